@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+
+class AvailabilityIndex:
+    # which companies have a report on a date and complete returns over a period, as bitsets over all
+    # companies sorted by name. a window is the intersection of the bitsets of its report dates and
+    # return periods, so every matrix of a window has its companies in the same (sorted) order
+
+    def __init__(self, report_store, returns_panel):
+        self.returns_panel = returns_panel
+        self.companies = np.array(sorted(set(report_store.index["company"]) | set(returns_panel.companies)))
+
+        # company id of each column of the returns panel and column of each company id (-1 without returns)
+        self.panel_ids = np.searchsorted(self.companies, returns_panel.companies)
+        self.returns_columns = np.full(len(self.companies), -1)
+        self.returns_columns[self.panel_ids] = np.arange(len(self.panel_ids))
+
+        # one packed row of report bits per report date
+        report_dates, date_rows = np.unique(report_store.index["date"].values, return_inverse=True)
+        reports = np.zeros((len(report_dates), len(self.companies)), dtype=bool)
+        reports[date_rows, np.searchsorted(self.companies, report_store.index["company"])] = True
+        self.report_bits = np.packbits(reports, axis=1)
+        self.report_rows = {date: row for row, date in enumerate(pd.DatetimeIndex(report_dates))}
+
+    def reports_available(self, date):
+        row = self.report_rows.get(pd.Timestamp(date))
+        if row is None:
+            return np.zeros(self.report_bits.shape[1], dtype=np.uint8)
+
+        return self.report_bits[row]
+
+    def returns_available(self, start, stop):
+        complete = np.zeros(len(self.companies), dtype=bool)
+        complete[self.panel_ids[self.returns_panel.complete_columns(start, stop)]] = True
+
+        return np.packbits(complete)
+
+    def window(self, report_dates, return_periods):
+        # sorted ids of the companies with a report on every date and complete returns in every period
+        bits = [self.reports_available(date) for date in report_dates]
+        bits += [self.returns_available(start, stop) for start, stop in return_periods]
+
+        return np.flatnonzero(np.unpackbits(np.bitwise_and.reduce(bits), count=len(self.companies)))
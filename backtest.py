@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+
+class BacktestAccumulator:
+    # realized returns of several strategies over consecutive out-of-sample windows, written into a
+    # preallocated array that doubles its capacity when it is full
+
+    def __init__(self, strategies, capacity=1024):
+        self.strategies = list(strategies)
+        self.returns = np.empty((capacity, len(self.strategies)))
+        self.length = 0
+        self.windows = []
+
+    def append(self, label, window_returns):
+        # realized returns (T x strategies) of a window
+        stop = self.length + len(window_returns)
+
+        if stop > len(self.returns):
+            grown = np.empty((max(stop, 2 * len(self.returns)), len(self.strategies)))
+            grown[:self.length] = self.returns[:self.length]
+            self.returns = grown
+
+        self.returns[self.length:stop] = window_returns
+        self.windows.append((label, self.length, stop))
+        self.length = stop
+
+    def portfolio_returns(self):
+        return pd.DataFrame(self.returns[:self.length], columns=self.strategies)
+
+    def window_std(self):
+        # standard deviation of the returns of every strategy in every window
+        rows = [self.returns[first:last].std(axis=0) for _, first, last in self.windows]
+
+        return pd.DataFrame(rows, index=[label for label, _, _ in self.windows], columns=self.strategies)
+
+    def wealth(self, start=100):
+        # value of every strategy, compounded from start
+        wealth = np.empty((self.length + 1, len(self.strategies)))
+        wealth[0] = start
+        np.cumprod(1 + self.returns[:self.length], axis=0, out=wealth[1:])
+        wealth[1:] *= start
+
+        return pd.DataFrame(wealth, columns=self.strategies)
+
+    def statistics(self, periods_per_year=252):
+        # annualized sharpe ratio, standard deviation and maximum drawdown of every strategy
+        returns = self.returns[:self.length]
+        mean = returns.mean(axis=0)
+        std = returns.std(axis=0)
+
+        wealth = self.wealth(1).values
+        drawdown = wealth / np.maximum.accumulate(wealth, axis=0) - 1
+
+        return pd.DataFrame({
+            "mean": mean,
+            "std": std,
+            "sharpe": mean / std * np.sqrt(periods_per_year),
+            "max_drawdown": drawdown.min(axis=0),
+            "total_return": wealth[-1] - 1,
+        }, index=self.strategies)
@@ -0,0 +1,133 @@
+import argparse
+import os
+import time
+from lxml import html
+from filing_cache import FilingCache
+from scrape_reports import (SKIP_WORDS, PreviousNode, is_10k_section_end, is_10q_section_end, is_item_1a_header,
+                            parse_filing)
+
+
+def largest_filings(cache, filing_type, n):
+    # the n largest cached filings of filing_type, by compressed size
+    directory = os.path.join(cache.root, "filings")
+    sizes = []
+    for name in os.listdir(directory):
+        if name.endswith(".html.gz"):
+            accession = name[:-len(".html.gz")]
+            meta = cache.meta(accession)
+            if meta is not None and meta["filing_type"] == filing_type:
+                sizes.append((os.path.getsize(os.path.join(directory, name)), accession))
+
+    return [accession for _, accession in sorted(sizes, reverse=True)[:n]]
+
+
+def concatenating_parse_filing(filing_type, raw):
+    # the parser before the streaming rewrite, kept to compare against: the whole document tree is built,
+    # its text nodes are read with xpath and the sentences are accumulated by string concatenation
+    if filing_type == "10-K":
+        is_section_end, min_length = is_10k_section_end, 3
+    else:
+        is_section_end, min_length = is_10q_section_end, 4
+
+    fromhere = False
+    current_text = ""
+    risk_factors_text = []
+    prev = PreviousNode("")
+
+    for text in html.fromstring(raw).xpath("//text()"):
+        if fromhere:
+            if is_section_end(text, prev):
+                fromhere = False
+                if len(risk_factors_text) > 10:
+                    break
+            text = text.replace("\n", " ").replace("\xa0", " ").strip()
+            if fromhere and len(text) > min_length and not (
+                    any(word in text.lower() for word in SKIP_WORDS) and len(text) < 40):
+                if text[0] in ",;:":
+                    current_text = current_text + text
+                else:
+                    current_text = current_text + " " + text
+                if text[-1] in ".!?":
+                    risk_factors_text.append(current_text + " ")
+                    current_text = ""
+        if is_item_1a_header(text, prev):
+            fromhere = True
+        prev = PreviousNode(text)
+
+    return "\n".join(risk_factors_text), fromhere
+
+
+def long_sentence_filing(n_nodes):
+    # a 10-K whose risk factors contain one sentence of n_nodes text nodes without punctuation, e.g. a table
+    # of numbers. concatenation copies the sentence once per node, which is quadratic in its length
+    rows = "".join("<tr><td>segment {} revenue and operating income</td></tr>".format(i) for i in range(n_nodes))
+    sentences = "".join("<p>Risk {} could have a material adverse effect on our business.</p>".format(i)
+                        for i in range(20))
+
+    return ("<html><body><p>Item 1A.</p><p>Risk Factors</p>" + sentences + "<table>" + rows + "</table>"
+            "<p>Item 1B.</p><p>Unresolved Staff Comments</p><p>None.</p></body></html>").encode("utf-8")
+
+
+def best_time(parse, filing_type, raw, repeat):
+    # best of repeat runs, the first run also pays for warming up the caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(filing_type, raw)
+        times.append(time.perf_counter() - start)
+
+    return min(times), result
+
+
+def benchmark_filings(filings, filing_type, repeat=3, compare=False):
+    # filings is a list of (name, raw filing). with compare, the concatenating parser runs on the same
+    # filings and both timings are reported
+    total_bytes = 0
+    total_time = 0
+    total_baseline = 0
+    for name, raw in filings:
+        seconds, (text_content, _) = best_time(parse_filing, filing_type, raw, repeat)
+        total_bytes += len(raw)
+        total_time += seconds
+        line = "{}: {:.1f} MB in {:.3f} s, {} characters of risk factors".format(
+            name, len(raw) / 1024 ** 2, seconds, len(text_content))
+
+        if compare:
+            baseline, (baseline_content, _) = best_time(concatenating_parse_filing, filing_type, raw, repeat)
+            total_baseline += baseline
+            line += ", concatenating parser {:.3f} s ({:.1f}x){}".format(
+                baseline, baseline / seconds, "" if baseline_content == text_content else ", OUTPUT DIFFERS")
+        print(line)
+
+    print("{} filings, {:.1f} MB in {:.3f} s ({:.1f} MB/s).".format(
+        len(filings), total_bytes / 1024 ** 2, total_time, total_bytes / 1024 ** 2 / total_time))
+    if compare:
+        print("concatenating parser: {:.3f} s, {:.1f}x slower.".format(total_baseline, total_baseline / total_time))
+
+
+def benchmark(cache_root="filings_cache", filing_type="10-K", n=20, repeat=3, compare=False):
+    cache = FilingCache(cache_root)
+    filings = [(accession, cache.raw(accession)) for accession in largest_filings(cache, filing_type, n)]
+    if len(filings) == 0:
+        print("no {} filings in {}.".format(filing_type, cache_root))
+        return
+
+    benchmark_filings(filings, filing_type, repeat, compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the risk factor parser on the largest cached filings")
+    parser.add_argument("cache_root", nargs="?", default="filings_cache")
+    parser.add_argument("--type", default="10-K", choices=["10-K", "10-Q"])
+    parser.add_argument("-n", type=int, default=20, help="number of filings")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", action="store_true", help="also time the concatenating parser")
+    parser.add_argument("--long-sentence", type=int, metavar="NODES",
+                        help="time a synthetic 10-K with one sentence of NODES text nodes instead")
+    args = parser.parse_args()
+
+    if args.long_sentence is not None:
+        benchmark_filings([("long sentence", long_sentence_filing(args.long_sentence))], "10-K", args.repeat,
+                          args.compare)
+    else:
+        benchmark(args.cache_root, args.type, args.n, args.repeat, args.compare)
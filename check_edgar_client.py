@@ -0,0 +1,115 @@
+import os
+import tempfile
+import requests
+from edgar_client import EdgarClient
+from edgar_stub_server import PERIODS, start_server
+from filing_cache import FilingCache
+
+# exercises EdgarClient against the local stub server: retries of failed and throttled requests, giving up
+# once the retries are used up, the user agent, and revalidating cached filing lists with conditional
+# requests (304)
+
+CIK = "0000000001"
+
+
+def check_retries(server):
+    # a third of the requests fail, every filing still arrives
+    server.fail_rate = 0.3
+    server.hits.clear()
+    client = EdgarClient(base_url=server.url(), requests_per_second=200, retries=8, backoff=0.01)
+
+    company = client.company(CIK)
+    filings = list(client.iter_filings(company, "10-K", page_size=4))
+    raws = [filing.raw() for filing in filings]
+
+    assert company.name == "STUB INDUSTRIES INC"
+    assert [filing.content["Period of Report"] for filing in filings] == PERIODS["10-K"]
+    # the 2019 and 2020 filings are linked through the inline xbrl viewer, the document itself is fetched
+    assert all(b"Risk Factors" in raw for raw in raws)
+    assert all("/ix" not in filing.document_url for filing in filings)
+    assert server.hits["/ix"] == 0
+    assert server.hits["503"] > 0
+    print("retries: {} filings, {} requests failed with 503 and were retried".format(len(filings),
+                                                                                      server.hits["503"]))
+
+
+def check_throttling(server):
+    # edgar answers clients that go too fast with 403, those requests are retried like a 503
+    server.fail_rate = 0.3
+    server.fail_status = 403
+    server.hits.clear()
+    client = EdgarClient(base_url=server.url(), requests_per_second=200, retries=8, backoff=0.01)
+
+    filings = list(client.iter_filings(client.company(CIK), "10-Q", page_size=10))
+
+    server.fail_status = 503
+    assert len(filings) == len(PERIODS["10-Q"])
+    assert server.hits["403"] > 0
+    print("throttling: {} filings, {} requests throttled with 403 and were retried".format(len(filings),
+                                                                                          server.hits["403"]))
+
+
+def check_user_agent(server):
+    server.fail_rate = 0.0
+    server.user_agents.clear()
+    os.environ["EDGAR_USER_AGENT"] = "stub check (stub@example.org)"
+    try:
+        EdgarClient(base_url=server.url()).company(CIK)
+        EdgarClient(base_url=server.url(), user_agent="explicit (explicit@example.org)").company(CIK)
+    finally:
+        del os.environ["EDGAR_USER_AGENT"]
+
+    assert server.user_agents == {"stub check (stub@example.org)", "explicit (explicit@example.org)"}
+    print("user agent: sent {}".format(sorted(server.user_agents)))
+
+
+def check_retries_exhausted(server):
+    server.fail_rate = 1.0
+    server.hits.clear()
+    client = EdgarClient(base_url=server.url(), requests_per_second=200, retries=2, backoff=0.01)
+
+    try:
+        client.company(CIK)
+    except requests.HTTPError as e:
+        assert e.response.status_code == 503
+    else:
+        raise AssertionError("a request that always fails must raise")
+
+    assert server.hits["503"] == 3
+    print("retries exhausted: gave up after {} requests".format(server.hits["503"]))
+
+
+def check_conditional_requests(server, cache_root):
+    server.fail_rate = 0.0
+
+    def scrape():
+        server.hits.clear()
+        client = EdgarClient(base_url=server.url(), requests_per_second=200, backoff=0.01,
+                             cache=FilingCache(cache_root))
+        company = client.company(CIK)
+        filings = list(client.iter_filings(company, "10-Q", page_size=10))
+
+        return [(filing.content, filing.raw()) for filing in filings]
+
+    first = scrape()
+    first_hits = dict(server.hits)
+    second = scrape()
+
+    # the filing lists are answered with 304 and the filings come from the cache
+    assert first == second
+    assert first_hits.get("304", 0) == 0
+    assert server.hits["304"] == server.hits["/cgi-bin/browse-edgar"] > 0
+    assert sum(count for path, count in server.hits.items() if path.startswith("/Archives")) == 0
+    print("conditional requests: {} filings, {} filing list pages revalidated with 304".format(len(second),
+                                                                                             server.hits["304"]))
+
+
+if __name__ == "__main__":
+    server = start_server(seed=0)
+    check_retries(server)
+    check_throttling(server)
+    check_retries_exhausted(server)
+    check_user_agent(server)
+    with tempfile.TemporaryDirectory() as cache_root:
+        check_conditional_requests(server, cache_root)
+    server.shutdown()
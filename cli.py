@@ -0,0 +1,155 @@
+import argparse
+import ast
+import csv
+import os
+import sys
+
+# command line entry point. the modules of a subcommand are imported when it runs, and data is only loaded
+# by the subcommands that need it, so reading cached results or evaluating the baselines of one window
+# starts without loading sklearn, matplotlib or the report store
+#
+#   python cli.py results --sort std_impr_comb
+#   python cli.py window 2018-01-01 --model
+#   python cli.py trial -p model=svd -p n_dims=10 --plot results/realized.png
+#   python cli.py simulate 2008-01-01 2020-12-31 -p model_train_sample=window --workers 8
+
+
+def parse_params(pairs):
+    # key=value pairs with python literals as values, anything else is a string
+    params = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        try:
+            params[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            params[key] = value
+
+    return params
+
+
+def read_table(path):
+    with open(path, newline="") as f:
+        return {row[0]: row[1:] for row in csv.reader(f, delimiter=";")}
+
+
+def results_table(directory="results"):
+    # frobenius errors averaged over all windows and standard deviations of the whole sample of every trial
+    # with results in directory, as written by run_trial
+    header = None
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("frob_") and name.endswith(".csv")):
+            continue
+        trial_name = name[len("frob_"):-len(".csv")]
+        std_path = os.path.join(directory, "std_" + trial_name + ".csv")
+        if not os.path.isfile(std_path):
+            continue
+
+        frob = read_table(os.path.join(directory, name))
+        std = read_table(std_path)
+        columns = ["frob_" + column for column in frob[""]] + ["std_" + column for column in std[""]]
+        if header is None:
+            header = columns
+        if columns != header:
+            continue
+
+        rows.append([trial_name] + [float(value) for value in frob["all"] + std["whole"]])
+
+    return ["trial_name"] + (header or []), rows
+
+
+def print_results(args):
+    header, rows = results_table(args.directory)
+    if args.sort is not None:
+        rows.sort(key=lambda row: row[header.index(args.sort)])
+
+    widths = [max([len(header[0])] + [len(row[0]) for row in rows])] + [max(len(column), 11) for column in header[1:]]
+    print(" ".join([header[0].ljust(widths[0])] + [column.rjust(width)
+                                                   for column, width in zip(header[1:], widths[1:])]))
+    for row in rows:
+        print(" ".join([row[0].ljust(widths[0])] + ["{:>{}.6g}".format(value, width)
+                                                    for value, width in zip(row[1:], widths[1:])]))
+
+
+def evaluate_window(args):
+    # one walk-forward step whose out-of-sample period starts at args.start, with the baselines and,
+    # with --model, the model of the trial
+    import pandas as pd
+    from pandas.tseries.offsets import QuarterEnd
+    import predict_covariance_matrix as pcm
+    from walk_forward import WalkForward, walk_forward_windows
+    from estimators import BASELINE_ESTIMATORS
+
+    params = dict(pcm.default_params, **parse_params(args.param))
+    test_start = pd.Timestamp(args.start)
+    test_stop = test_start + QuarterEnd(startingMonth=3, n=params["time_horizon_quarters"])
+    report_store, returns_panel = pcm.load_data(params["frequency"])
+
+    if args.model:
+        df_frob, backtest = pcm.run_walk_forward(params, report_store, returns_panel, test_start, test_stop,
+                                                 pcm.training_cutoff(test_start))
+    else:
+        engine = WalkForward(report_store, returns_panel, BASELINE_ESTIMATORS)
+        windows = walk_forward_windows(test_start, test_stop, params["sample_quarters"],
+                                       params["time_horizon_quarters"])
+        df_frob, backtest = engine.run(windows)
+
+    df_window = pd.DataFrame({"frob": df_frob.iloc[0], "std": backtest.window_std().iloc[0]})
+    print(df_window)
+
+
+def trial(args):
+    import predict_covariance_matrix as pcm
+
+    params = dict(pcm.default_params, **parse_params(args.param))
+    report_store, returns_panel = pcm.load_data(params["frequency"])
+    df_frob, df_var, port_r_equal, port_r_model = pcm.run_trial(params, report_store, returns_panel,
+                                                                workers=args.workers)
+
+    if args.plot is not None:
+        pcm.plot_returns(port_r_equal, port_r_model, args.plot)
+
+
+def simulate(args):
+    from simulate_trading import simulate_trading
+
+    results = simulate_trading(parse_params(args.param), args.start, args.stop, args.workers, args.output)
+    print(results["stats"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="covariance estimation from risk reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    results_parser = subparsers.add_parser("results", help="print the table of the cached trial results")
+    results_parser.add_argument("--directory", default="results")
+    results_parser.add_argument("--sort", help="column to sort the trials by")
+    results_parser.set_defaults(run=print_results)
+
+    window_parser = subparsers.add_parser("window", help="evaluate the estimators on one window")
+    window_parser.add_argument("start", help="first day of the out-of-sample period")
+    window_parser.add_argument("--model", action="store_true", help="also evaluate the model of the trial")
+    window_parser.set_defaults(run=evaluate_window)
+
+    trial_parser = subparsers.add_parser("trial", help="run a trial on the eval or test sample")
+    trial_parser.add_argument("--plot", help="file the portfolio values are plotted to")
+    trial_parser.add_argument("--workers", type=int, default=1)
+    trial_parser.set_defaults(run=trial)
+
+    simulate_parser = subparsers.add_parser("simulate", help="walk-forward backtest over a test period")
+    simulate_parser.add_argument("start")
+    simulate_parser.add_argument("stop")
+    simulate_parser.add_argument("--workers", type=int)
+    simulate_parser.add_argument("--output", default="results/simulation")
+    simulate_parser.set_defaults(run=simulate)
+
+    for subparser in [window_parser, trial_parser, simulate_parser]:
+        subparser.add_argument("-p", "--param", action="append", default=[], metavar="KEY=VALUE",
+                               help="trial parameter, see default_params in predict_covariance_matrix.py")
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,127 +1,181 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import re
+import shutil
 import pandas as pd
 import chardet
+from report_store import ReportStoreWriter
 
 file = "data/companies.csv"
 
+NON_ASCII_PATTERN = re.compile(rb"[\x80-\xff]")
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# below this confidence chardet guesses, e.g. cp437 at 0.32 for cp1252 text with a few degree and
+# registered signs. utf-8 text is detected at 0.8 and above
+MIN_ENCODING_CONFIDENCE = 0.8
+# detected encodings by sha1 of the report bytes, None if the detection was not confident
+_encodings = {}
+
 df_companies = pd.read_csv(file, sep=";")
 
 def consolidate_reports(df):
     if len(df[df["has_content"]].index) == 1:
         return df[df["has_content"]]
     else:
-        new_content = ""
-        for i, row in df[df["has_content"]].iterrows():
-            new_content += row["content"]
+        new_content = "".join(df.loc[df["has_content"], "content"])
         new_df = pd.DataFrame({"content": [new_content]}, index=df.iloc[0].index)
         return new_df
 
-def clean_encoding(text):
-    as_bytes = bytes(text, encoding="raw_unicode_escape")
+def detect_encoding(as_bytes):
+    # the encoding of a filing is detected once, from a sample that starts just before its first non-ascii byte
+    digest = hashlib.sha1(as_bytes).digest()
+    if digest not in _encodings:
+        start = max(NON_ASCII_PATTERN.search(as_bytes).start() - 1024, 0)
+        detected = chardet.detect(as_bytes[start:start + ENCODING_SAMPLE_BYTES])
+        confident = detected["confidence"] is not None and detected["confidence"] >= MIN_ENCODING_CONFIDENCE
+        _encodings[digest] = detected["encoding"] if confident else None
 
-    enc = chardet.detect(as_bytes)["encoding"]
+    return _encodings[digest]
 
-    if enc and not 'cp949':
-        decoded = as_bytes.decode(enc).replace("\\u2019", "'")
-    else:
-        decoded = as_bytes.decode("cp1252").replace("\\u2019", "'")
+def clean_encoding(text):
+    as_bytes = bytes(text, encoding="raw_unicode_escape")
 
+    if as_bytes.isascii():
+        return as_bytes.decode("ascii").replace("\\u2019", "'")
 
+    # cp949 is what chardet reports for a lot of cp1252 text. filings are cp1252 unless detected otherwise
+    enc = detect_encoding(as_bytes)
+    if enc and enc.lower() != "cp949":
+        try:
+            return as_bytes.decode(enc).replace("\\u2019", "'")
+        except (UnicodeDecodeError, LookupError):
+            pass
 
-    return decoded
-
-def create_columns(with_duplicates=True):
-    companies = df_companies.loc[:,["company", "ticker"]].dropna().drop_duplicates()
+    return as_bytes.decode("cp1252").replace("\\u2019", "'")
 
+def assemble_company_reports(ticker, company, with_duplicates):
+    # the reports of one company as (dates, segment lists). every report is a list of segments:
+    # the 10-K followed by the 10-Qs filed since
     file_format = "data/{ticker}_{id}_{type}.csv"
 
-    ind = 0
-
-    df_reports = pd.DataFrame()
-
-
-    for i, row in companies.iterrows():
-        location_10k = file_format.format(ticker=row["ticker"], id=row["company"], type="10-K")
-        location_10q = file_format.format(ticker=row["ticker"], id=row["company"], type="10-Q")
-
-        df_10k = pd.read_csv(location_10k).drop_duplicates()
-        df_10k.index = df_10k.index = pd.to_datetime(df_10k["Unnamed: 0"])
-        df_10k = df_10k.sort_index()
-        df_10q = pd.read_csv(location_10q).drop_duplicates()
-        df_10q.index = df_10q.index = pd.to_datetime(df_10q["Unnamed: 0"])
-        df_10q = df_10q.sort_index()
-
-        reports = []
-        dates = []
-        last_date = df_10q.index[-1]
-
-        for date in df_10k.index.drop_duplicates():
-            quarter_end_date = date - pd.tseries.offsets.DateOffset(days=1) + pd.tseries.offsets.QuarterEnd()
-            quarter_start_date = date - pd.offsets.QuarterBegin() + pd.Timedelta(days=1)
-
-            df_date = df_10k.loc[quarter_start_date:quarter_end_date]
-
-            length = len(df_date)
-
-            if length == 1:
-                report_10k = df_date.iloc[0]["content"]
-
-            elif length > 1:
-                df_date = consolidate_reports(df_date)
-                report_10k = df_date.iloc[0]["content"]
-            else:
-                report_10k = pd.NA
-
-            if not pd.isna(report_10k):
-                report_10k = clean_encoding(report_10k)
-                reports.append(report_10k)
-                dates.append(quarter_end_date)
-
-                for i in range(3):
-
-                    quarter_start_date = quarter_end_date + pd.Timedelta(days=1)
-                    quarter_end_date = quarter_start_date + pd.tseries.offsets.QuarterEnd()
-                    if last_date < quarter_end_date:
-                        break
-                    last_quarter_df = df_10q.loc[quarter_start_date:quarter_end_date]
-                    length = len(last_quarter_df.index)
-                    if length == 1:
-                        report = last_quarter_df.iloc[0]["content"]
-
-                    elif length > 1:
-                        last_quarter_df = consolidate_reports(last_quarter_df)
-                        report = last_quarter_df.iloc[0]["content"]
+    location_10k = file_format.format(ticker=ticker, id=company, type="10-K")
+    location_10q = file_format.format(ticker=ticker, id=company, type="10-Q")
+
+    df_10k = pd.read_csv(location_10k).drop_duplicates()
+    df_10k.index = df_10k.index = pd.to_datetime(df_10k["Unnamed: 0"])
+    df_10k = df_10k.sort_index()
+    df_10q = pd.read_csv(location_10q).drop_duplicates()
+    df_10q.index = df_10q.index = pd.to_datetime(df_10q["Unnamed: 0"])
+    df_10q = df_10q.sort_index()
+
+    reports = []
+    dates = []
+    last_date = df_10q.index[-1]
+
+    for date in df_10k.index.drop_duplicates():
+        quarter_end_date = date - pd.tseries.offsets.DateOffset(days=1) + pd.tseries.offsets.QuarterEnd()
+        quarter_start_date = date - pd.offsets.QuarterBegin() + pd.Timedelta(days=1)
+
+        df_date = df_10k.loc[quarter_start_date:quarter_end_date]
+
+        length = len(df_date)
+
+        if length == 1:
+            report_10k = df_date.iloc[0]["content"]
+
+        elif length > 1:
+            df_date = consolidate_reports(df_date)
+            report_10k = df_date.iloc[0]["content"]
+        else:
+            report_10k = pd.NA
+
+        if not pd.isna(report_10k):
+            report_10k = clean_encoding(report_10k)
+            segments = [report_10k]
+            reports.append(segments)
+            dates.append(quarter_end_date)
+
+            for i in range(3):
+
+                quarter_start_date = quarter_end_date + pd.Timedelta(days=1)
+                quarter_end_date = quarter_start_date + pd.tseries.offsets.QuarterEnd()
+                if last_date < quarter_end_date:
+                    break
+                last_quarter_df = df_10q.loc[quarter_start_date:quarter_end_date]
+                length = len(last_quarter_df.index)
+                if length == 1:
+                    report = last_quarter_df.iloc[0]["content"]
+
+                elif length > 1:
+                    last_quarter_df = consolidate_reports(last_quarter_df)
+                    report = last_quarter_df.iloc[0]["content"]
+
+                else:
+                    report = pd.NA
+
+
+                if (not pd.isna(report)) and (len(report.split()) > 100):
+                    report = clean_encoding(report)
+                    segments = segments + [report]
+                    reports.append(segments)
+                    dates.append(quarter_end_date)
+                else:
+                    if with_duplicates:
+                        reports.append(segments)
+                        dates.append(quarter_end_date)
 
-                    else:
-                        report = pd.NA
+    # companies with two reports for the same quarter are left out
+    if len(set(dates)) != len(dates):
+        return [], []
 
+    return dates, reports
 
-                    if (not pd.isna(report)) and (len(report.split()) > 100):
-                        report = clean_encoding(report)
-                        content = report_10k + report
-                        reports.append(content)
-                        dates.append(quarter_end_date)
-                        report_10k = content
-                    else:
-                        if with_duplicates:
-                            reports.append(report_10k)
-                            dates.append(quarter_end_date)
+def write_company_partition(path, name, dates, reports):
+    # one parquet file per company, read back with pd.read_parquet(path)
+    partition = os.path.join(path, "company={}".format(name))
+    os.makedirs(partition, exist_ok=True)
+    df = pd.DataFrame({"date": pd.to_datetime(dates), "text": ["".join(segments) for segments in reports]})
+    df.to_parquet(os.path.join(partition, "reports.parquet"), index=False)
 
+def assemble_company(args):
+    ticker, company, with_duplicates, parquet_path = args
+    name = ticker + "_" + str(company)
+    dates, reports = assemble_company_reports(ticker, company, with_duplicates)
 
+    if parquet_path is not None:
         if len(reports) > 0:
-            df = pd.Series(reports, index=dates)
-            if len(df[df.index.duplicated()]) == 0:
-                df_reports[row["ticker"] + "_" + str(row["company"])] = df
+            write_company_partition(parquet_path, name, dates, reports)
+        return name, len(reports)
 
+    return name, dates, reports
 
-    if with_duplicates:
-        df_reports.to_csv("data/reports_with_duplicates_final.csv", index_label="date")
-    else:
-        df_reports.to_csv("data/reports_without_duplicates_final.csv", index_label="date")
+def create_columns(with_duplicates=True, workers=None, parquet=False):
+    # companies are assembled by a pool of processes. by default the reports are written to a report
+    # store in company order by this process, with parquet=True every worker writes the reports of its
+    # companies to their own partition of a parquet dataset instead
+    companies = df_companies.loc[:,["company", "ticker"]].dropna().drop_duplicates()
 
+    path = "data/reports_with_duplicates" if with_duplicates else "data/reports_without_duplicates"
+    parquet_path = path + "_parquet" if parquet else None
+    tasks = [(row["ticker"], row["company"], with_duplicates, parquet_path) for _, row in companies.iterrows()]
 
+    if parquet:
+        # partitions of companies that no longer have reports must not survive a rebuild
+        shutil.rmtree(parquet_path, ignore_errors=True)
 
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if parquet:
+            n_reports = sum(n for _, n in pool.map(assemble_company, tasks))
+            print("stored {} reports in {}.".format(n_reports, parquet_path))
+            return
 
-    print(df_reports.head())
+        writer = ReportStoreWriter(path + "_store")
+        for name, dates, reports in pool.map(assemble_company, tasks):
+            for date, segments in zip(dates, reports):
+                writer.add(date, name, segments)
+        writer.close()
 
 
-create_columns(False)
\ No newline at end of file
+if __name__ == "__main__":
+    create_columns(False)
@@ -1,22 +1,80 @@
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
 import numpy as np
+import pandas as pd
+from returns_panel import save_returns_panel
 
-dir = r"C:\Users\Lukas Tilmann\Documents\uni\Semester 8\BA\stock_tickers\{}.csv"
+# one csv with a Date and a Close column per ticker
+PRICE_DIR = os.environ.get("STOCK_TICKER_DIR", "data/stock_tickers")
 
 file = "data/companies.csv"
 
-df_companies = pd.read_csv(file, sep=";")
 
-df_all = pd.DataFrame()
+def read_close_prices(price_dir, ticker):
+    df = pd.read_csv(os.path.join(price_dir, ticker + ".csv"), usecols=["Date", "Close"], index_col="Date")
+
+    return pd.to_datetime(df.index).values, df["Close"].to_numpy(dtype=np.float64)
+
+
+def price_panel(series):
+    # one row per day on which any of the stocks traded, NaN where a stock has no price
+    calendar = np.unique(np.concatenate([dates for dates, _ in series]))
+    prices = np.full((len(calendar), len(series)), np.nan)
+    for j, (dates, close) in enumerate(series):
+        prices[np.searchsorted(calendar, dates), j] = close
+
+    return calendar, prices
+
+
+def forward_fill(values):
+    # every row replaced by the last row at or before it where the column is not NaN
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+
+    return values[rows, np.arange(values.shape[1])]
+
+
+def returns_from_prices(prices):
+    # the return of a stock is relative to its previous price, so days on which it didn't trade are
+    # skipped like in a pct_change over the stock's own dates
+    previous = np.full_like(prices, np.nan)
+    previous[1:] = forward_fill(prices)[:-1]
+
+    return prices / previous - 1
+
+
+def weekly_prices(calendar, prices):
+    # the last price of every stock in each week ending on friday, NaN if it has no price that week.
+    # weeks are labelled with their last trading day
+    weeks = pd.DatetimeIndex(calendar).to_period("W-FRI").asi8
+    week_end = np.flatnonzero(np.r_[weeks[1:] != weeks[:-1], True])
+    week_start = np.r_[0, week_end[:-1] + 1]
+
+    traded = np.add.reduceat(~np.isnan(prices), week_start, axis=0) > 0
+    week_prices = np.where(traded, forward_fill(prices)[week_end], np.nan)
+
+    return calendar[week_end], week_prices
+
+
+def build_returns(price_dir=PRICE_DIR, output="data/returns", workers=8):
+    df_companies = pd.read_csv(file, sep=";")
+    companies = df_companies.loc[:, ["company", "ticker"]].dropna().drop_duplicates()
+    tickers = list(companies["ticker"])
+    names = [row["ticker"] + "_" + str(row["company"]) for _, row in companies.iterrows()]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        series = list(pool.map(lambda ticker: read_close_prices(price_dir, ticker), tickers))
 
-companies = df_companies.loc[:,["company", "ticker"]].dropna().drop_duplicates()
+    # daily and weekly returns come from the same prices
+    calendar, prices = price_panel(series)
+    save_returns_panel(output, "daily", calendar, names, returns_from_prices(prices))
 
-for i, row in companies.iterrows():
-        df = pd.read_csv(dir.format(row["ticker"]), index_col="Date")
-        df.index = pd.to_datetime(df.index)
-        df["Move"] = df["Close"].pct_change()
-        df_all[row["ticker"] + "_" + str(row["company"])] = df["Move"]
+    week_dates, week_prices = weekly_prices(calendar, prices)
+    save_returns_panel(output, "weekly", week_dates, names, returns_from_prices(week_prices))
 
-df_all.to_csv("data/stock_returns.csv")
+    print("stored returns of {} stocks over {} days and {} weeks.".format(len(names), len(calendar), len(week_dates)))
 
 
+if __name__ == "__main__":
+    build_returns(*sys.argv[1:2])
@@ -0,0 +1,259 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urljoin, urlparse
+from lxml import html
+import requests
+from filing_cache import accession_number
+
+SEC_BASE_URL = "https://www.sec.gov"
+# the sec asks automated clients to identify themselves with a contact address and to stay below 10 requests
+# per second. the placeholder address is replaced through EDGAR_USER_AGENT or the user_agent of the client
+USER_AGENT = "risk_factor_correlations research scraper (contact@example.com)"
+# edgar throttles clients that go too fast with 403 instead of 429
+RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
+
+
+def unwrap_viewer_url(url):
+    # inline xbrl filings (most filings since 2019) link their document through the javascript viewer,
+    # /ix?doc=/Archives/..., whose page holds none of the filing's text
+    parsed = urlparse(url)
+    if parsed.path == "/ix" and "doc" in parse_qs(parsed.query):
+        return urljoin(url, parse_qs(parsed.query)["doc"][0])
+
+    return url
+
+
+def primary_document_href(index_page, filing_type):
+    # link of the row of the document table whose type is the filing type, the first link if no row is.
+    # the table also lists exhibits and graphics
+    table = index_page.find_class("tableFile")[0]
+    for row in table.xpath(".//tr"):
+        links = row.xpath(".//a[@href]")
+        if len(links) > 0 and filing_type in [cell.text_content().strip() for cell in row.xpath("./td")]:
+            return links[0].attrib["href"]
+
+    return table.xpath(".//a[@href]")[0].attrib["href"]
+
+
+class RateLimiter:
+    # allows at most requests_per_second requests per host, shared by all threads
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class EdgarCompany:
+
+    def __init__(self, name, cik):
+        self.name = name
+        self.cik = cik
+
+
+class FilingDocument:
+    # the information table of a filing's index page ("Period of Report", "Filing Date", ...) and the
+    # filing itself. the filing is downloaded once, on first access, and parsed from the same bytes
+
+    def __init__(self, url, content, document_url=None, client=None, accession=None):
+        self.url = url
+        self.content = content
+        self.document_url = document_url
+        self.client = client
+        self.accession = accession
+        self._raw = None
+        self._lxml = None
+
+    def raw(self):
+        if self._raw is None:
+            self._raw = self.client.get_filing(self.accession, self.document_url)
+
+        return self._raw
+
+    def lxml(self):
+        if self._lxml is None:
+            self._lxml = html.fromstring(self.raw())
+
+        return self._lxml
+
+
+class EdgarClient:
+    # fetches company filing lists and filings from edgar. base_url can point to a local server
+    # with canned pages, everything else about the client stays the same.
+    # with a FilingCache, filings are only downloaded once and filing lists are revalidated with
+    # conditional requests
+
+    def __init__(self, base_url=SEC_BASE_URL, requests_per_second=8, retries=5, backoff=1.0, timeout=30,
+                 user_agent=None, cache=None):
+        self.base_url = base_url
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.user_agent = user_agent or os.environ.get("EDGAR_USER_AGENT", USER_AGENT)
+        self.cache = cache
+        self.local = threading.local()
+
+    def session(self):
+        # one session per thread, requests sessions are not guaranteed to be thread safe
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+            self.local.session.headers["User-Agent"] = self.user_agent
+
+        return self.local.session
+
+    def request(self, url, headers=None):
+        url = urljoin(self.base_url, url)
+        host = urlparse(url).netloc
+
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(host)
+            try:
+                response = self.session().get(url, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError("{} for {}".format(response.status_code, url), response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt < self.retries:
+                # exponential backoff with jitter
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+        raise error
+
+    def get(self, url):
+        return self.request(url).content
+
+    def get_page(self, url):
+        # pages that change over time (filing lists) are revalidated instead of downloaded again
+        if self.cache is None:
+            return self.get(url)
+
+        body, validators = self.cache.page(url)
+        headers = {}
+        if body is not None and "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if body is not None and "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        response = self.request(url, headers)
+        if response.status_code == 304:
+            return body
+
+        validators = {}
+        if "ETag" in response.headers:
+            validators["etag"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            validators["last_modified"] = response.headers["Last-Modified"]
+        if len(validators) > 0:
+            self.cache.put_page(url, response.content, validators)
+
+        return response.content
+
+    def get_filing(self, accession, document_url):
+        if self.cache is not None:
+            data = self.cache.raw(accession)
+            if data is not None:
+                return data
+
+        data = self.get(document_url)
+        if self.cache is not None:
+            self.cache.put_raw(accession, data)
+
+        return data
+
+    def filings_url(self, cik, filing_type, count, start=0):
+        return "/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type={type}&dateb=&owner=include&count={count}" \
+               "&start={start}".format(cik=cik, type=filing_type, count=count, start=start)
+
+    def company(self, cik):
+        cik = str(cik).zfill(10)
+        tree = html.fromstring(self.get_page(self.filings_url(cik, "", 10)))
+        name = tree.find_class("companyName")[0].text.strip()
+
+        return EdgarCompany(name, cik)
+
+    def filing_document(self, index_url, company, filing_type):
+        accession = accession_number(index_url)
+        index_url = urljoin(self.base_url, index_url)
+
+        # the index page of a filing never changes, a cached copy is used as is
+        if self.cache is not None:
+            meta = self.cache.meta(accession)
+            if meta is not None and unwrap_viewer_url(meta["document_url"]) != meta["document_url"]:
+                # cached before viewer links were unwrapped, the cached filing is the viewer page
+                self.cache.discard_raw(accession)
+                meta = None
+            if meta is not None:
+                return FilingDocument(index_url, meta["content"], meta["document_url"], self, accession)
+
+        index_page = self.get_html(index_url)
+
+        form_content = index_page.find_class("formContent")[0]
+        heads = [elem.text_content().strip() for elem in form_content.find_class("infoHead")]
+        infos = [elem.text_content().strip() for elem in form_content.find_class("info")]
+        content = dict(zip(heads, infos))
+
+        document_url = unwrap_viewer_url(urljoin(self.base_url, primary_document_href(index_page, filing_type)))
+
+        if self.cache is not None:
+            self.cache.put_meta(accession, {"cik": company.cik, "company": company.name, "filing_type": filing_type,
+                                            "content": content, "document_url": document_url})
+
+        return FilingDocument(index_url, content, document_url, self, accession)
+
+    def get_html(self, url):
+        return html.fromstring(self.get(url))
+
+    def iter_filings(self, company, filing_type, page_size=40):
+        # filings of filing_type, newest first. the filing list is requested page by page and the index
+        # page of a filing only when the previous one has been consumed, so a caller that stops at a
+        # cutoff date doesn't download anything beyond it
+        start = 0
+        while True:
+            tree = html.fromstring(self.get_page(self.filings_url(company.cik, filing_type, page_size, start)))
+            buttons = tree.xpath('//*[@id="documentsbutton"]')
+
+            for elem in buttons:
+                yield self.filing_document(elem.attrib["href"], company, filing_type)
+
+            if len(buttons) < page_size:
+                break
+            start += page_size
+
+
+class OfflineEdgarClient:
+    # serves companies and filings from a FilingCache only, for re-parsing without network access
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def company(self, cik):
+        cik = str(cik).zfill(10)
+        names = [meta["company"] for _, meta in self.cache.filings(cik, "10-K") + self.cache.filings(cik, "10-Q")]
+
+        return EdgarCompany(names[0] if len(names) > 0 else cik, cik)
+
+    def get_filing(self, accession, document_url):
+        data = self.cache.raw(accession)
+        if data is None:
+            raise KeyError("filing {} is not in the cache".format(accession))
+
+        return data
+
+    def iter_filings(self, company, filing_type):
+        for accession, meta in self.cache.filings(company.cik, filing_type):
+            yield FilingDocument(meta["document_url"], meta["content"], meta["document_url"], self, accession)
@@ -0,0 +1,156 @@
+import collections
+import hashlib
+import http.server
+import os
+import random
+import re
+import sys
+import threading
+import urllib.parse
+
+# a local stand-in for the edgar pages EdgarClient reads, built from the canned pages in fixtures/edgar.
+# a share of the requests fails with 503 like a busy edgar server does (or with 403, as edgar throttles
+# clients that go too fast), filing lists carry an etag and are
+# answered with 304 when the client sends it back. filings from 2019 on link their document through the
+# inline xbrl viewer (/ix?doc=...) like edgar does, the viewer page has none of the text. point a client at it with
+# EdgarClient(base_url="http://127.0.0.1:<port>")
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "edgar")
+
+# cik -> company name
+COMPANIES = {"0000000001": "STUB INDUSTRIES INC", "0000000002": "EXAMPLE HOLDINGS CORP"}
+# periods of report, newest first
+PERIODS = {
+    "10-K": ["{}-12-31".format(year) for year in range(2020, 2010, -1)],
+    "10-Q": ["{}-{}".format(year, day) for year in range(2020, 2010, -1) for day in ["09-30", "06-30", "03-31"]],
+}
+
+
+def load_fixtures():
+    fixtures = {}
+    for name in os.listdir(FIXTURE_DIR):
+        with open(os.path.join(FIXTURE_DIR, name)) as f:
+            fixtures[name[:-len(".html")]] = f.read()
+
+    return fixtures
+
+
+def stub_filings():
+    # accession number -> (cik, filing type, period of report) of every filing the server knows
+    filings = {}
+    for cik in COMPANIES:
+        for filing_type, periods in PERIODS.items():
+            for period in periods:
+                accession = "{}-{}-{:06d}".format(cik, period[2:4], len(filings))
+                filings[accession] = (cik, filing_type, period)
+
+    return filings
+
+
+class StubEdgarHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_page(self, body, status=200, validate=False):
+        body = body.encode("utf-8")
+        headers = {"Content-Type": "text/html"}
+        if validate:
+            headers["ETag"] = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                self.server.count("304")
+                status, body = 304, b""
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        self.server.count(url.path)
+        self.server.user_agents.add(self.headers.get("User-Agent"))
+        if self.server.should_fail():
+            self.server.count(str(self.server.fail_status))
+            return self.send_page("server busy", self.server.fail_status)
+
+        fixtures = self.server.fixtures
+        if url.path == "/ix":
+            return self.send_page("<html><body><script src=\"/ixviewer/js/app.js\"></script></body></html>")
+
+        if url.path == "/cgi-bin/browse-edgar":
+            query = urllib.parse.parse_qs(url.query)
+            cik = query["CIK"][0].zfill(10)
+            filing_type = query.get("type", [""])[0]
+            start = int(query.get("start", ["0"])[0])
+            count = int(query.get("count", ["40"])[0])
+            if cik not in COMPANIES:
+                return self.send_page("no matching cik", 404)
+
+            filings = [(accession, period) for accession, (filing_cik, t, period) in self.server.filings.items()
+                       if filing_cik == cik and t == filing_type]
+            rows = "".join(fixtures["company_row"].format(
+                filing_type=filing_type, index_url="/Archives/edgar/data/{}/{}-index.htm".format(cik, accession),
+                filing_date=period) for accession, period in filings[start:start + count])
+
+            return self.send_page(fixtures["company"].format(name=COMPANIES[cik], cik=cik, rows=rows), validate=True)
+
+        match = re.match(r"/Archives/edgar/data/\d+/([\d-]+?)(-index)?\.htm$", url.path)
+        if match is None or match.group(1) not in self.server.filings:
+            return self.send_page("not found", 404)
+
+        accession = match.group(1)
+        cik, filing_type, period = self.server.filings[accession]
+        if match.group(2):
+            document_url = "/Archives/edgar/data/{}/{}.htm".format(cik, accession)
+            document_href = "/ix?doc=" + document_url if period >= "2019" else document_url
+            exhibit_url = "/Archives/edgar/data/{}/{}-ex31.htm".format(cik, accession)
+            return self.send_page(fixtures["filing_index"].format(filing_type=filing_type, filing_date=period,
+                                                                  period=period, document_href=document_href,
+                                                                  exhibit_url=exhibit_url, accession=accession))
+
+        return self.send_page(fixtures[filing_type].format(name=COMPANIES[cik], period=period))
+
+
+class StubEdgarServer(http.server.ThreadingHTTPServer):
+    # counts the requests per path, the failed requests by status and the 304s in hits, and collects the
+    # user agents the requests were sent with
+
+    def __init__(self, address, fail_rate=0.1, seed=None, fail_status=503):
+        super().__init__(address, StubEdgarHandler)
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.random = random.Random(seed)
+        self.fixtures = load_fixtures()
+        self.filings = stub_filings()
+        self.hits = collections.Counter()
+        self.user_agents = set()
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.fail_rate
+
+    def count(self, key):
+        with self.lock:
+            self.hits[key] += 1
+
+    def url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+
+def start_server(port=0, fail_rate=0.1, seed=None):
+    # serves in a background thread, port 0 picks a free port
+    server = StubEdgarServer(("127.0.0.1", port), fail_rate, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = StubEdgarServer(("127.0.0.1", port))
+    print("serving stub edgar pages on " + server.url())
+    server.serve_forever()
@@ -0,0 +1,103 @@
+import numpy as np
+
+# baseline covariance estimators of a sample window, all computed from the same statistics: the centered
+# returns and their gram matrix. with the gram matrix taken from a RollingCovariance, no estimator needs
+# another O(T n^2) pass over the returns
+
+
+def window_statistics(returns, cov):
+    # centered returns (T x n) and their gram matrix, cov is the sample covariance (ddof 1) of returns
+    centered = returns - returns.mean(axis=0)
+    gram = cov * (len(returns) - 1)
+
+    return centered, gram
+
+
+def mean_off_diagonal(matrix):
+    return matrix[np.triu_indices(matrix.shape[0], k=1)].mean()
+
+
+def equal_covariance(cov):
+    # every covariance is the mean covariance, every variance the mean variance
+    cov_equal = np.full(cov.shape, mean_off_diagonal(cov))
+    np.fill_diagonal(cov_equal, np.diagonal(cov).mean())
+
+    return cov_equal
+
+
+def constant_correlation_covariance(cov, cor):
+    # every correlation is the mean correlation, the variances are kept
+    std = np.sqrt(np.diagonal(cov))
+    cor_constant = np.full(cov.shape, mean_off_diagonal(cor))
+    np.fill_diagonal(cor_constant, 1)
+
+    return cor_constant * np.outer(std, std)
+
+
+def ledoit_wolf_shrinkage(centered, gram):
+    # the shrinkage intensity of sklearn's ledoit_wolf_shrinkage, with <X.T, X> taken from the gram
+    # matrix and the sum of <X2.T, X2> from the squared row norms, which is O(T n) instead of O(T n^2)
+    n_samples, n_features = centered.shape
+    if n_features == 1:
+        return 0.0
+
+    emp_cov_trace = np.diagonal(gram) / n_samples
+    mu = np.sum(emp_cov_trace) / n_features
+    beta_ = np.sum(np.sum(centered ** 2, axis=1) ** 2)
+    delta_ = np.sum(gram ** 2) / n_samples ** 2
+
+    beta = 1.0 / (n_features * n_samples) * (beta_ / n_samples - delta_)
+    delta = (delta_ - 2.0 * mu * emp_cov_trace.sum() + n_features * mu ** 2) / n_features
+    beta = min(beta, delta)
+
+    return 0.0 if beta == 0 else beta / delta
+
+
+def ledoit_wolf_covariance(centered, gram):
+    # the covariance of sklearn's LedoitWolf().fit(returns): the empirical covariance (ddof 0)
+    # shrunk towards mu * I
+    n_samples, n_features = centered.shape
+    emp_cov = gram / n_samples
+    mu = np.trace(emp_cov) / n_features
+    shrinkage = ledoit_wolf_shrinkage(centered, gram)
+
+    shrunk_cov = (1.0 - shrinkage) * emp_cov
+    shrunk_cov.flat[::n_features + 1] += shrinkage * mu
+
+    return shrunk_cov
+
+
+# estimators of a walk-forward window (see walk_forward.py), functions of the window and the estimates
+# of the estimators before them
+
+
+def sample_estimator(window, estimates):
+    return window.cov
+
+
+def equal_estimator(window, estimates):
+    return equal_covariance(window.cov)
+
+
+def constant_correlation_estimator(window, estimates):
+    return constant_correlation_covariance(window.cov, window.cor)
+
+
+def ledoit_wolf_estimator(window, estimates):
+    return ledoit_wolf_covariance(*window_statistics(window.returns, window.cov))
+
+
+BASELINE_ESTIMATORS = {
+    "equal": equal_estimator,
+    "constant": constant_correlation_estimator,
+    "sample": sample_estimator,
+    "lw": ledoit_wolf_estimator,
+}
+
+
+def ensemble_estimator(weight, first, second):
+    # weighted average of the estimates of two earlier estimators
+    def estimate(window, estimates):
+        return weight * estimates[first] + (1 - weight) * estimates[second]
+
+    return estimate
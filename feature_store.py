@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from file_utils import atomic_write, file_lock
+
+
+class FeatureStore:
+    # embeddings of the reports per date, keyed by (model type, n_dims, idf flag, model registry key).
+    # an entry is one .npz file per date with the company names and their rows, topic vectors as float32,
+    # tfidf rows as the arrays of a sparse csr matrix. each date holds the rows of all companies transformed
+    # so far, missing companies are transformed on demand and merged into the stored entry. workers of a
+    # backtest or sweep can add to the same date at once, so the merge runs under a lock file and the entry
+    # is replaced in one step
+
+    def __init__(self, root, model_type, n_dims, idf, fingerprint, transform):
+        key = "{model}_{dims}_{idf}_{fingerprint}".format(model=model_type, dims=n_dims, idf=int(idf),
+                                                          fingerprint=fingerprint)
+        self.directory = os.path.join(root, key)
+        self.transform = transform
+        self.loaded = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, date):
+        return os.path.join(self.directory, pd.Timestamp(date).strftime("%Y-%m-%d") + ".npz")
+
+    def load(self, date):
+        if date in self.loaded:
+            return self.loaded[date]
+
+        path = self._path(date)
+        if not os.path.isfile(path):
+            return None
+
+        with np.load(path) as data:
+            companies = data["companies"]
+            if "features" in data:
+                features = data["features"]
+            else:
+                features = scipy.sparse.csr_matrix((data["data"], data["indices"], data["indptr"]),
+                                                   shape=tuple(data["shape"]))
+
+        entry = ({company: i for i, company in enumerate(companies)}, companies, features)
+        self.loaded[date] = entry
+
+        return entry
+
+    def save(self, date, companies, features):
+        arrays = {"companies": np.asarray(companies, dtype=str)}
+        if scipy.sparse.issparse(features):
+            features = scipy.sparse.csr_matrix(features)
+            arrays.update(data=features.data, indices=features.indices, indptr=features.indptr,
+                          shape=np.array(features.shape))
+        else:
+            arrays["features"] = np.asarray(features, dtype=np.float32)
+
+        atomic_write(self._path(date), lambda f: np.savez(f, **arrays))
+        self.loaded.pop(date, None)
+
+    def features(self, reports):
+        # reports is a one-row frame of report texts for one date, as returned by get_reports_for_date
+        date = reports.index[0]
+        companies = list(reports.columns)
+
+        entry = self.load(date)
+        if entry is None or any(company not in entry[0] for company in companies):
+            with file_lock(self._path(date) + ".lock"):
+                # another process may have stored the date or added companies since it was loaded
+                self.loaded.pop(date, None)
+                entry = self.load(date)
+                if entry is None:
+                    stored_companies = []
+                    missing = companies
+                else:
+                    positions, stored_companies, _ = entry
+                    missing = [company for company in companies if company not in positions]
+
+                if len(missing) > 0:
+                    new_features = self.transform(reports[missing])
+                    if entry is None:
+                        features = new_features
+                    elif scipy.sparse.issparse(new_features):
+                        features = scipy.sparse.vstack([entry[2], new_features])
+                    else:
+                        features = np.concatenate([entry[2], np.asarray(new_features, dtype=np.float32)])
+
+                    self.save(date, list(stored_companies) + missing, features)
+                    entry = self.load(date)
+
+        positions, _, features = entry
+        rows = [positions[company] for company in companies]
+        selected = features[rows]
+
+        if scipy.sparse.issparse(selected):
+            return selected.astype(np.float64)
+
+        return np.asarray(selected, dtype=np.float64)
@@ -0,0 +1,62 @@
+import contextlib
+import fcntl
+import os
+import tempfile
+
+# file helpers shared by the on-disk caches and stores
+
+
+def atomic_write(path, write):
+    # write(f) fills a temporary file in the directory of path, which then replaces path in one step.
+    # readers see the old or the new file, never a partial one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(path, data):
+    atomic_write(path, lambda f: f.write(data))
+
+
+def touch(path):
+    # the modification time doubles as the last access time for eviction
+    os.utime(path)
+
+
+def evict_least_recently_used(directory, suffixes, max_bytes, keep=()):
+    # removes the files ending in one of suffixes that were used least recently (see touch) until they
+    # take up at most max_bytes. returns the bytes left and the names of the removed files
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(suffixes):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        os.remove(os.path.join(directory, name))
+        removed.append(name)
+        total -= size
+
+    return total, removed
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    # exclusive lock between processes, held while the block runs. the lock file itself is left in place
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
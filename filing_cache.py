@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from file_utils import atomic_write_bytes, evict_least_recently_used, touch
+
+ACCESSION_PATTERN = re.compile(r"(\d{10}-\d{2}-\d{6})")
+
+
+def accession_number(index_url):
+    # filings are immutable once filed, so the accession number identifies the content.
+    # urls without one (e.g. a local test server) fall back to a hash of the url
+    match = ACCESSION_PATTERN.search(index_url)
+    if match:
+        return match.group(1)
+
+    return hashlib.sha1(index_url.encode("utf-8")).hexdigest()
+
+
+class FilingCache:
+    # on-disk cache of raw edgar pages.
+    # filings/<accession>.json - index page information of a filing (company, type, period, document url)
+    # filings/<accession>.html.gz - the filing itself, gzip compressed
+    # pages/<sha1 of url>.gz / .json - filing lists with their etag / last-modified for conditional requests
+    # once the compressed files grow beyond max_bytes, the least recently used filings are evicted.
+    # their index information is kept, so an evicted filing is downloaded again on the next scrape
+
+    def __init__(self, root="filings_cache", max_bytes=20 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._index = None
+
+        os.makedirs(os.path.join(root, "filings"), exist_ok=True)
+        os.makedirs(os.path.join(root, "pages"), exist_ok=True)
+
+        self.total_bytes = sum(os.path.getsize(os.path.join(root, "filings", name))
+                               for name in os.listdir(os.path.join(root, "filings")) if name.endswith(".gz"))
+
+    def _filing_path(self, accession, suffix):
+        return os.path.join(self.root, "filings", accession + suffix)
+
+    def _page_path(self, url, suffix):
+        return os.path.join(self.root, "pages", hashlib.sha1(url.encode("utf-8")).hexdigest() + suffix)
+
+    def meta(self, accession):
+        path = self._filing_path(accession, ".json")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put_meta(self, accession, meta):
+        atomic_write_bytes(self._filing_path(accession, ".json"), json.dumps(meta).encode("utf-8"))
+        with self.lock:
+            if self._index is not None:
+                self._index[accession] = meta
+
+    def raw(self, accession):
+        path = self._filing_path(accession, ".html.gz")
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            data = gzip.decompress(f.read())
+        touch(path)
+
+        return data
+
+    def put_raw(self, accession, data):
+        compressed = gzip.compress(data)
+        atomic_write_bytes(self._filing_path(accession, ".html.gz"), compressed)
+        with self.lock:
+            self.total_bytes += len(compressed)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def discard_raw(self, accession):
+        path = self._filing_path(accession, ".html.gz")
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self.lock:
+                self.total_bytes -= size
+
+    def evict(self):
+        with self.lock:
+            self.total_bytes, _ = evict_least_recently_used(os.path.join(self.root, "filings"), (".gz",),
+                                                            self.max_bytes)
+
+    def page(self, url):
+        # cached body and the validators it was served with, or (None, {})
+        body_path = self._page_path(url, ".gz")
+        if not os.path.isfile(body_path):
+            return None, {}
+        with open(body_path, "rb") as f:
+            body = gzip.decompress(f.read())
+        with open(self._page_path(url, ".json")) as f:
+            validators = json.load(f)
+
+        return body, validators
+
+    def put_page(self, url, body, validators):
+        atomic_write_bytes(self._page_path(url, ".json"), json.dumps(validators).encode("utf-8"))
+        atomic_write_bytes(self._page_path(url, ".gz"), gzip.compress(body))
+
+    def filings(self, cik, filing_type):
+        # index information of all cached filings of a company, newest first
+        with self.lock:
+            if self._index is None:
+                self._index = {}
+                directory = os.path.join(self.root, "filings")
+                for name in os.listdir(directory):
+                    if name.endswith(".json"):
+                        with open(os.path.join(directory, name)) as f:
+                            self._index[name[:-len(".json")]] = json.load(f)
+            metas = [(accession, meta) for accession, meta in self._index.items()
+                     if meta["cik"] == cik and meta["filing_type"] == filing_type]
+
+        return sorted(metas, key=lambda item: item[1]["content"].get("Period of Report", ""), reverse=True)
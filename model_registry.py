@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import pickle
+from file_utils import atomic_write, evict_least_recently_used, file_lock, touch
+
+
+def corpus_hash(corpus):
+    h = hashlib.sha256()
+    for doc in corpus:
+        h.update(doc.encode("utf-8", errors="surrogatepass"))
+        h.update(b"\0")
+
+    return h.hexdigest()
+
+
+def model_key(params, corpus_digest):
+    # the key covers every hyperparameter (including the training cutoff) and the training corpus,
+    # so a model is never reused for a different cutoff or corpus version
+    description = json.dumps({"params": params, "corpus": corpus_digest}, sort_keys=True, default=str)
+
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()[:24]
+
+
+class ModelRegistry:
+    # content-addressed store of pickled models. files are written atomically, loaded only when a
+    # model is requested, and the least recently used files are evicted once the registry grows
+    # beyond max_bytes.
+
+    def __init__(self, root="models", max_bytes=4 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.loaded = {}
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key + ".p")
+
+    def contains(self, key):
+        return key in self.loaded or os.path.isfile(self.path(key))
+
+    def load(self, key):
+        if key not in self.loaded:
+            path = self.path(key)
+            with open(path, "rb") as f:
+                self.loaded[key] = pickle.load(f)
+            touch(path)
+
+        return self.loaded[key]
+
+    def save(self, key, obj):
+        atomic_write(self.path(key), lambda f: pickle.dump(obj, f))
+
+        self.loaded[key] = obj
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        keep = () if keep is None else (keep + ".p",)
+        _, removed = evict_least_recently_used(self.root, (".p",), self.max_bytes, keep)
+        for name in removed:
+            self.loaded.pop(name[:-len(".p")], None)
+
+    def get_or_train(self, params, corpus_digest, train):
+        key = model_key(params, corpus_digest)
+
+        if self.contains(key):
+            return key, self.load(key)
+
+        # processes that need the same model at the same time (e.g. the workers of a sweep) wait for the
+        # first one to train it and then load it
+        with file_lock(self.path(key) + ".lock"):
+            if self.contains(key):
+                return key, self.load(key)
+
+            obj = train()
+            self.save(key, obj)
+
+        return key, obj
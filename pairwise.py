@@ -0,0 +1,102 @@
+import numpy as np
+import scipy.sparse
+
+# upper bound for the size of one block of feature-wise pair features (in bytes).
+# the block size in pairs is derived from it, so wide tfidf rows get small blocks.
+MAX_BLOCK_BYTES = 64 * 1024 ** 2
+
+
+def exp_dist(x_1, x_2):
+    dist = np.absolute(x_1 - x_2)
+    sim = np.exp(-1 * np.square(dist))
+
+    return sim
+
+
+def upper_triangle_indices(n):
+    return np.triu_indices(n, k=1)
+
+
+def default_block_size(n_features):
+    return max(1, MAX_BLOCK_BYTES // (8 * n_features))
+
+
+def iter_exp_dist_blocks(feature_data, block_size=None):
+    # yields (start, stop, block) with block holding exp_dist for the pairs start:stop
+    # of the upper triangle. works on dense arrays and on sparse (tfidf) matrices
+    n, d = feature_data.shape
+    if block_size is None:
+        block_size = default_block_size(d)
+
+    is_sparse = scipy.sparse.issparse(feature_data)
+    if is_sparse:
+        feature_data = scipy.sparse.csr_matrix(feature_data)
+    else:
+        feature_data = np.asarray(feature_data)
+
+    rows, cols = upper_triangle_indices(n)
+
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        block = feature_data[rows[start:stop]] - feature_data[cols[start:stop]]
+        if is_sparse:
+            block = block.toarray()
+        block = np.asarray(block, dtype=np.float64)
+
+        np.square(block, out=block)
+        np.negative(block, out=block)
+        np.exp(block, out=block)
+
+        yield start, stop, block
+
+
+def exp_dist_pairs(feature_data, block_size=None):
+    n, d = feature_data.shape
+    similarities = np.empty((n * (n - 1) // 2, d))
+
+    for start, stop, block in iter_exp_dist_blocks(feature_data, block_size):
+        similarities[start:stop] = block
+
+    return similarities
+
+
+def cosine_pairs(feature_data):
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    rows, cols = upper_triangle_indices(feature_data.shape[0])
+    similarities = cosine_similarity(feature_data)
+
+    return similarities[rows, cols].reshape(-1, 1)
+
+
+def pairwise_features(feature_data, feature_wise, block_size=None):
+    # one row per company pair (i < j), in the same order as np.triu_indices
+    if feature_wise:
+        return exp_dist_pairs(feature_data, block_size)
+
+    return cosine_pairs(feature_data)
+
+
+def upper_triangle_to_matrix(values, n, diagonal=0):
+    rows, cols = upper_triangle_indices(n)
+    matrix = np.empty((n, n))
+    matrix[rows, cols] = values
+    matrix[cols, rows] = values
+    np.fill_diagonal(matrix, diagonal)
+
+    return matrix
+
+
+def predict_pairwise_matrix(model, scaler, feature_data, feature_wise, block_size=None):
+    # scaler and model are run on all pairs at once (block by block for feature-wise
+    # features) instead of once per pair
+    n = feature_data.shape[0]
+
+    if feature_wise:
+        predictions = np.empty(n * (n - 1) // 2)
+        for start, stop, block in iter_exp_dist_blocks(feature_data, block_size):
+            predictions[start:stop] = np.ravel(model.predict(scaler.transform(block)))
+    else:
+        predictions = np.ravel(model.predict(scaler.transform(cosine_pairs(feature_data))))
+
+    return upper_triangle_to_matrix(predictions, n)
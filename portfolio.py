@@ -0,0 +1,77 @@
+import numpy as np
+import scipy.linalg
+
+# estimates with a larger condition number are treated as singular and regularized
+MAX_CONDITION = 1e12
+# for positive definite estimates, the squared ratio of the largest to the smallest diagonal entry of the
+# cholesky factor is a lower bound of the condition number, a cheap check that catches near-singular
+# sample covariances without an svd
+MIN_CHOLESKY_RATIO = MAX_CONDITION ** -0.5
+# the ridge grows tenfold at most this many times, from ridge to ridge * 1e11 times the mean variance
+MAX_RIDGE_STEPS = 12
+
+
+def _well_conditioned(chol):
+    diagonal = np.diagonal(chol)
+
+    return diagonal.min() > MIN_CHOLESKY_RATIO * diagonal.max()
+
+
+def regularized_solve(sigma, ones, ridge=1e-8):
+    # sigma^-1 1 for a matrix that is not positive definite. well conditioned (e.g. indefinite model estimates)
+    # it is solved as is, near-singular (e.g. a sample covariance with more stocks than returns) a ridge of
+    # ridge * mean variance is added to the diagonal and grown tenfold until the matrix is well conditioned.
+    # an estimate with nan or inf entries (e.g. the constant correlation estimate of a window with a stock
+    # without variance) has no solution, its weights are nan and the other estimates go on
+    if not np.isfinite(sigma).all():
+        return np.full(sigma.shape[0], np.nan)
+
+    scale = np.abs(np.trace(sigma)) / sigma.shape[0]
+    if not scale > 0:
+        scale = 1.0
+
+    regularized = sigma
+    for _ in range(MAX_RIDGE_STEPS):
+        if np.linalg.cond(regularized) < MAX_CONDITION:
+            break
+        regularized = sigma + ridge * scale * np.eye(sigma.shape[0])
+        ridge *= 10
+
+    return np.linalg.solve(regularized, ones)
+
+
+def _cholesky_or_none(sigma):
+    try:
+        return np.linalg.cholesky(sigma)
+    except np.linalg.LinAlgError:
+        return np.full(sigma.shape, np.nan)
+
+
+def min_variance_weights(sigmas):
+    # weights of the minimum variance portfolio, sigma^-1 1 / (1' sigma^-1 1), for one covariance matrix
+    # (n x n) or a stack of them (k x n x n). every matrix is factorized once, all in one batched call
+    sigmas = np.asarray(sigmas, dtype=np.float64)
+    single = sigmas.ndim == 2
+    if single:
+        sigmas = sigmas[np.newaxis]
+
+    try:
+        chols = np.linalg.cholesky(sigmas)
+    except np.linalg.LinAlgError:
+        # a stack with one matrix that is not positive definite fails as a whole
+        chols = np.stack([_cholesky_or_none(sigma) for sigma in sigmas])
+
+    ones = np.ones(sigmas.shape[1])
+    weights = np.empty(sigmas.shape[:2])
+    for i, chol in enumerate(chols):
+        if not np.isnan(chol).any() and _well_conditioned(chol):
+            x = scipy.linalg.cho_solve((chol, True), ones)
+        else:
+            x = regularized_solve(sigmas[i], ones)
+        weights[i] = x / x.sum()
+
+    return weights[0] if single else weights
+
+
+def portfolio_variance(weights, sigma):
+    return weights @ sigma @ weights
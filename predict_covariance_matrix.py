@@ -1,40 +1,57 @@
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from sklearn.decomposition import LatentDirichletAllocation, TruncatedSVD
-from sklearn.metrics.pairwise import cosine_similarity, pairwise_distances
-from sklearn.linear_model import LinearRegression, ElasticNetCV, RidgeCV
-from sklearn.covariance import LedoitWolf
-from sklearn.preprocessing import StandardScaler
 import pandas as pd
-import os
-import pickle
 import numpy as np
 from datetime import datetime
-from pandas.tseries.offsets import QuarterBegin, QuarterEnd, DateOffset
-from pandas import Timedelta
-import matplotlib.pyplot as plt
-import csv
+from pandas.tseries.offsets import QuarterEnd, DateOffset
+from portfolio import portfolio_variance
+from pairwise import exp_dist, exp_dist_pairs, predict_pairwise_matrix
+from window_model import predict_cov_window_model
+from feature_store import FeatureStore
+from model_registry import ModelRegistry
+from report_store import load_report_store
+from availability import AvailabilityIndex
+from estimators import BASELINE_ESTIMATORS, mean_off_diagonal, ensemble_estimator
+from rolling_cov import RollingCovariance
+from walk_forward import WalkForward, walk_forward_windows
+from returns_panel import ReturnsPanel, has_returns_panel, load_returns_panel
+from segment_vectorizer import SegmentCounter, document_term_matrix, fit_segment_vectorizer
 
+# sklearn and matplotlib are imported by the functions that use them, so entry points that only evaluate
+# the baselines or read results start without loading them
 
-def train_tfidf_model(df, train_last, idf=True):
-    corpus = df.loc[:train_last].values.flatten()
-    notna_corpus = corpus[~pd.isnull(corpus)]
-    vectorizer = TfidfVectorizer(stop_words="english", strip_accents="unicode", min_df=10, use_idf=idf)
+
+def training_corpus(report_store, train_last):
+    # the reports up to train_last as lists of segment ids, and the texts of all distinct segments
+    documents = report_store.corpus_documents(train_last)
+    segment_ids = sorted({segment for document in documents for segment in document})
+
+    return documents, segment_ids, report_store.segment_texts(segment_ids)
+
+
+def train_tfidf_model(report_store, train_last, idf=True, min_df=10):
+    from sklearn.feature_extraction.text import TfidfTransformer, CountVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    documents, segment_ids, segment_texts = training_corpus(report_store, train_last)
 
     if idf:
         print("training tfidf model.")
     else:
         print("training tf model")
 
-    vectorizer = vectorizer.fit(notna_corpus)
+    count_vectorizer, counts = fit_segment_vectorizer(CountVectorizer(stop_words="english", strip_accents="unicode"),
+                                                      documents, segment_ids, segment_texts, min_df)
+    vectorizer = make_pipeline(count_vectorizer, TfidfTransformer(use_idf=idf).fit(counts))
 
     return vectorizer
 
 
-def train_lda_model(df, train_last, n_dims):
-    corpus = df.loc[:train_last].values.flatten()
-    notna_corpus = corpus[~pd.isnull(corpus)]
-    vectorizer = CountVectorizer(stop_words="english", min_df=10)
-    bow_vector = vectorizer.fit_transform(notna_corpus)
+def train_lda_model(report_store, train_last, n_dims, min_df=10):
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.decomposition import LatentDirichletAllocation
+
+    documents, segment_ids, segment_texts = training_corpus(report_store, train_last)
+    vectorizer, bow_vector = fit_segment_vectorizer(CountVectorizer(stop_words="english"), documents, segment_ids,
+                                                    segment_texts, min_df)
 
     print("training lda model with {} dimensions.".format(str(n_dims)))
     lda = LatentDirichletAllocation(n_components=n_dims, random_state=0)
@@ -46,11 +63,17 @@ def train_lda_model(df, train_last, n_dims):
     return vectorizer, lda
 
 
-def train_svd_model(df, train_last, n_dims):
-    corpus = df.loc[:train_last].values.flatten()
-    notna_corpus = corpus[~pd.isnull(corpus)]
-    vectorizer = TfidfVectorizer(stop_words="english", strip_accents="unicode", min_df=10, use_idf=True)
-    bow_vector = vectorizer.fit_transform(notna_corpus)
+def train_svd_model(report_store, train_last, n_dims, min_df=10):
+    from sklearn.feature_extraction.text import TfidfTransformer, CountVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.pipeline import make_pipeline
+
+    documents, segment_ids, segment_texts = training_corpus(report_store, train_last)
+    count_vectorizer, counts = fit_segment_vectorizer(CountVectorizer(stop_words="english", strip_accents="unicode"),
+                                                      documents, segment_ids, segment_texts, min_df)
+    tfidf = TfidfTransformer(use_idf=True)
+    bow_vector = tfidf.fit_transform(counts)
+    vectorizer = make_pipeline(count_vectorizer, tfidf)
 
     print("training svd model with {} dimensions.".format(str(n_dims)))
     svd = TruncatedSVD(n_components=n_dims, random_state=0)
@@ -62,68 +85,26 @@ def train_svd_model(df, train_last, n_dims):
     return vectorizer, svd
 
 
-def get_reports_for_date(df, date):
-    df_date = df.loc[date:date]
-    df_date = df_date.dropna(axis=1)
+def get_reports_for_date(report_store, date, companies=None):
+    return report_store.reports_for_date(date, companies)
 
-    return df_date
 
-
-def topic_model_features(reports, vectorizer, model):
+def topic_model_features(reports, vectorizer, model, counter):
     if isinstance(reports, pd.DataFrame):
         reports = reports.iloc[0]
 
-    vector_bow = vectorizer.transform(reports)
+    vector_bow = document_term_matrix(list(reports), vectorizer, counter)
 
     vector_topics = model.transform(vector_bow)
 
     return vector_topics
 
 
-def tfidf_features(reports, vectorizer):
+def tfidf_features(reports, vectorizer, counter):
     if isinstance(reports, pd.DataFrame):
         reports = reports.iloc[0]
 
-    return vectorizer.transform(reports)
-
-
-def get_returns_for_period(df, start, stop):
-    df = df.loc[start:stop]
-    # print(df)
-    df = df.dropna(axis=1)
-
-    return df
-
-
-def compute_cov_matrix(returns, corr=False):
-    if corr:
-        matrix = np.corrcoef(returns.values.transpose())
-    else:
-        matrix = np.cov(returns.values.transpose())
-    df = pd.DataFrame(matrix, index=returns.columns, columns=returns.columns)
-
-    return df
-
-
-def find_column_intersection(list_dfs):
-    list_columns = []
-
-    for df in list_dfs:
-        list_columns.append(set(df.columns))
-
-    in_all = set.intersection(*list_columns)
-
-    list_dfs_new = []
-
-    for df in list_dfs:
-        list_dfs_new.append(df[in_all])
-
-    return list_dfs_new
-
-
-def predict_cov_sample(prev_sample, corr=False):
-
-    return compute_cov_matrix(prev_sample, corr).values
+    return document_term_matrix(list(reports), vectorizer, counter)
 
 
 def predict_mean(prev_sample):
@@ -142,61 +123,10 @@ def eval_predictions(true, pred):
 
 
 def calculate_portfolio_var(w, sigma):
-    w = np.asmatrix(w)
-    sigma = np.asmatrix(sigma)
+    return portfolio_variance(np.ravel(w), sigma)
 
-    return (w.transpose() * sigma * w)
 
-
-def optimal_portfolio_weights(sigma):
-    size = sigma.shape[0]
-    sigma = np.asmatrix(sigma)
-    one = np.ones((size, 1))
-    one = np.asmatrix(one)
-    w_star = (np.linalg.inv(sigma) * one) / (one.T * np.linalg.inv(sigma) * one)
-
-    return w_star
-
-
-def realized_portfolio_returns(returns, w_mat, returns_previous):
-    w = np.asarray(w_mat).T
-    portfolio_returns = returns * w
-    whole_portfolio_returns = np.sum(portfolio_returns, axis=1)
-
-    return_mean = whole_portfolio_returns.mean()
-    return_var = whole_portfolio_returns.var()
-    return_std = np.sqrt(return_var)
-    sharpe = (return_mean / np.sqrt(return_var)) * np.sqrt(252)
-
-    #portfolio_returns = returns_previous
-    #for r in whole_portfolio_returns:
-    #    portfolio_returns.append(portfolio_returns[-1] * (1 + r))
-
-    print("sharpe ratio: " + str(sharpe))
-    print("r std: " + str(return_std))
-    print("-----")
-
-    portfolio_returns = np.concatenate((returns_previous, whole_portfolio_returns))
-
-    return portfolio_returns, return_std
-
-def realize_returns(start, portfolio_returns):
-
-    port_returns = [start]
-    for r in portfolio_returns:
-        port_returns.append(port_returns[-1] * (1 + r))
-
-    return port_returns
-
-
-def exp_dist(x_1, x_2):
-    dist = np.absolute(x_1 - x_2)
-    sim = np.exp(-1 * np.square(dist))
-
-    return sim
-
-
-def get_similarities_cov(mat, feature_data, sim_function, feature_wise, standardize):
+def get_similarities_cov(mat, feature_data, sim_function, feature_wise, standardize, block_size=None):
     flat_upper = mat[np.triu_indices(mat.shape[0], k=1)]
 
     if standardize:
@@ -205,20 +135,9 @@ def get_similarities_cov(mat, feature_data, sim_function, feature_wise, standard
     else:
         cov_mat = flat_upper
 
-    n = feature_data.shape[0]
-
     if feature_wise:
-
-        similarities = []
-
-        for i in range(n):
-            features_i = feature_data[i, :]
-            for j in range(i + 1, n):
-                features_j = feature_data[j, :]
-                pairwise_sim = sim_function(features_i, features_j)
-                similarities.append(pairwise_sim)
-
-        similarities = np.stack(similarities)
+        # exp_dist for all pairs, built in blocks of at most block_size pairs
+        similarities = exp_dist_pairs(feature_data, block_size)
 
     else:
         similarities = sim_function(feature_data)
@@ -228,16 +147,7 @@ def get_similarities_cov(mat, feature_data, sim_function, feature_wise, standard
 
 
 def predict_covariance_matrix_model(model, scaler, feature_data, mean_var, mean_cov, feature_wise, add_mean):
-    # for feature wise:
-    if feature_wise:
-        sim_measure = lambda x_1, x_2: model.predict(scaler.transform(exp_dist(x_1, x_2).reshape(1, -1)))
-
-    # for pairwise
-    else:
-        sim_measure = lambda x_1, x_2: model.predict(
-            scaler.transform(cosine_similarity(x_1.reshape(1, -1), x_2.reshape(1, -1))))
-
-    matrix = pairwise_distances(feature_data, metric=sim_measure)
+    matrix = predict_pairwise_matrix(model, scaler, feature_data, feature_wise)
     if add_mean:
         matrix = matrix + mean_cov
     np.fill_diagonal(matrix, mean_var)
@@ -247,24 +157,14 @@ def predict_covariance_matrix_model(model, scaler, feature_data, mean_var, mean_
 
 def corr_matrix_to_cov_matrix(cor_matrix, diag):
 
-    v = np.asmatrix(diag)
-    v_matrix = np.sqrt(np.matmul(v.T, v))
-    cov_est = np.multiply(cor_matrix, v_matrix)
+    v_matrix = np.sqrt(np.outer(diag, diag))
+    cov_est = cor_matrix * v_matrix
 
     return cov_est
 
 
 def predict_correlation_matrix_model(model, scaler, feature_data, mean_cor, feature_wise, add_mean, cov_mat):
-    # for feature wise:
-    if feature_wise:
-        sim_measure = lambda x_1, x_2: model.predict(scaler.transform(exp_dist(x_1, x_2).reshape(1, -1)))
-
-    # for pairwise
-    else:
-        sim_measure = lambda x_1, x_2: model.predict(
-            scaler.transform(cosine_similarity(x_1.reshape(1, -1), x_2.reshape(1, -1))))
-
-    matrix = pairwise_distances(feature_data, metric=sim_measure)
+    matrix = predict_pairwise_matrix(model, scaler, feature_data, feature_wise)
     if add_mean:
         matrix = matrix + mean_cor
     np.fill_diagonal(matrix, 1)
@@ -274,125 +174,143 @@ def predict_correlation_matrix_model(model, scaler, feature_data, mean_cor, feat
     return matrix
 
 
-def constant_covariance_model(sample_cov, mean_corr):
-
-    diag = np.diag(sample_cov)
-    cor_matrix = np.full(sample_cov.shape, mean_corr)
-    np.fill_diagonal(cor_matrix, 1)
-    cov_est = corr_matrix_to_cov_matrix(cor_matrix, diag)
-
-    return cov_est
+# first day of the training sample of the models trained on the whole sample
+TRAIN_FIRST = datetime(year=2005, month=12, day=31)
 
-def predict_cov_window_model(prev_cov, feature_data_prev, feature_data_next):
+# parameters:
+default_params = {
+    #how many quarters are in one sub-period
+    "time_horizon_quarters": 1,
+    #how many quarters of returns the sample estimates are computed from
+    "sample_quarters": 4,
+    #how many quarters the test sample covers
+    "test_quarters": 8,
+    #frequency of returns
+    "frequency": "daily",
+    #can be "eval" for evaluating hyperparameters on the 2017-2018 sample or test for testing on 2019-2020 sample
+    "mode": "eval",
+    #if "window", the model is trained on the preceding sample only
+    #if "whole", a model trained on the whole period before the test/eval sample is used
+    "model_train_sample": "window",
+    #the featuee embedding that is used. Options are "lda", "tfidf" and "lsa"
+    "model": "lda",
+    #if using tfidf-space as embedding, this specifies if inverse document frrequency-weighting is applied
+    "idf": True,
+    #if true, feature-wise similarity measure is used
+    "feature_wise": False,
+    #when using topic model (lsa or lda), this specifies the number of topics
+    "n_dims": 5,
+    #minimum number of reports a term has to appear in to be part of the vocabulary
+    "min_df": 10,
+    #specifies if the regression model is fit with intercept
+    "with_intercept": False,
+    #specifies if cov-matrix is standardized by subtracting the mean covariance
+    "standardize_cov_matrix": True,
+    #if true, the model predicts correlation, not covariance. Only works with model trained on whole sample, not window
+    "predict_corr": False,
+    #the weight applied to the estimation generated from model when using the ensemble of model and lw-estimator
+    "ensemble_weight": 0.1,
+    #name of the files in which results are saved. If None, the name is derived from the parameters
+    "trial_name": None,
+}
+
+
+def make_trial_name(params):
+    if params["model"] == "tfidf":
+        embedding = "tfidf" if params["idf"] else "tf"
+    else:
+        embedding = "{model}{dims}dim".format(model=params["model"], dims=params["n_dims"])
+
+    parts = [embedding, "cor" if params["predict_corr"] else "cov"]
+    if params["standardize_cov_matrix"]:
+        parts.append("standardize")
+    if params["feature_wise"]:
+        parts.append("featurewise")
+    if params["with_intercept"]:
+        parts.append("intercept")
+    if params["sample_quarters"] != 4:
+        parts.append("sample{}Q".format(params["sample_quarters"]))
+    if params["test_quarters"] != 8:
+        parts.append("test{}Q".format(params["test_quarters"]))
+    parts += ["horizon{}Q".format(params["time_horizon_quarters"]), params["frequency"],
+              params["model_train_sample"], "ensemble{}".format(params["ensemble_weight"]),
+              "mindf{}".format(params["min_df"]), params["mode"]]
+
+    return "_".join(parts)
+
+
+def load_data(frequency):
+    # the store is written by create_reports.py. a reports csv is converted to a store on first use
+    report_store = load_report_store("data/reports_with_duplicates_store", "data/reports_with_duplicates_final.csv")
+    # the returns panel is written by create_returns.py, the csv files are the older format
+    if has_returns_panel("data/returns", frequency):
+        returns_panel = load_returns_panel("data/returns", frequency)
+    else:
+        if frequency == "daily":
+            df_returns = pd.read_csv("data/stock_returns.csv", index_col="Date")
+        if frequency == "weekly":
+            df_returns = pd.read_csv("data/stock_returns_weekly.csv", index_col="Date")
 
-    sim_measure = lambda x_1, x_2: cosine_similarity(x_1.reshape(1, -1), x_2.reshape(1, -1))
+        returns_panel = ReturnsPanel.from_frame(df_returns)
 
-    matrix_prev = pairwise_distances(feature_data_prev, metric=sim_measure)
-    np.fill_diagonal(matrix_prev, 0)
-    intercept_matrix = np.zeros(matrix_prev.shape)
-    np.fill_diagonal(intercept_matrix, 1)
+    return report_store, returns_panel
 
-    train_x = np.concatenate([intercept_matrix.reshape((1,-1)), matrix_prev.reshape(1,-1)], axis=1)
-    train_y = prev_cov.reshape(1,-1)
 
-    lin_reg = LinearRegression(fit_intercept=False).fit(train_x, train_y)
+def load_models(params, report_store, train_last, registry):
+    model = params["model"]
+    idf = params["idf"]
+    n_dims = params["n_dims"]
+    min_df = params["min_df"]
 
-    matrix_next = pairwise_distances(feature_data_next, metric=sim_measure)
-    np.fill_diagonal(matrix_next, 0)
-    intercept_matrix = np.zeros(matrix_next.shape)
-    np.fill_diagonal(intercept_matrix, 1)
+    # trained models are looked up in the registry by a hash of the training corpus and the hyperparameters
+    model_params = {"model": model, "train_last": train_last, "min_df": min_df}
+    if model == "tfidf":
+        model_params["idf"] = idf
+    else:
+        model_params["n_dims"] = n_dims
+    corpus_digest = report_store.corpus_hash(train_last)
 
-    next_x = np.concatenate([intercept_matrix.reshape((1,-1)), matrix_prev.reshape(1,-1)], axis=1)
+    if model == "tfidf":
+        model_key, vectorizer = registry.get_or_train(model_params, corpus_digest,
+                                                      lambda: train_tfidf_model(report_store, train_last, idf, min_df))
 
-    pred_y = lin_reg.predict(next_x)
-    matrix_pred = np.reshape(pred_y, matrix_next.shape)
+    if model in ["svd", "lda"]:
+        if model == "svd":
+            train = lambda: train_svd_model(report_store, train_last, n_dims, min_df)
+        else:
+            train = lambda: train_lda_model(report_store, train_last, n_dims, min_df)
+        model_key, (vectorizer, topic_model) = registry.get_or_train(model_params, corpus_digest, train)
 
-    return matrix_pred
+    # report embeddings are computed once per date and model and then read from the feature store
+    counter = SegmentCounter(report_store, vectorizer)
+    if model == "tfidf":
+        feature_store = FeatureStore("features", model, n_dims, idf, model_key,
+                                     lambda reports: tfidf_features(reports, vectorizer, counter))
+    if model in ["svd", "lda"]:
+        feature_store = FeatureStore("features", model, n_dims, idf, model_key,
+                                     lambda reports: topic_model_features(reports, vectorizer, topic_model, counter))
 
+    return feature_store
 
 
-# parameters:
-#how many quarters are in one sub-period
-time_horizon_quarters = 1
-#frequency of returns
-frequency = "daily"
-#can be "eval" for evaluating hyperparameters on the 2017-2018 sample or test for testing on 2019-2020 sample
-mode = "eval"
-#if "window", the model is trained on the preceding sample only
-#if "whole", a model trained on the whole period before the test/eval sample is used
-model_train_sample = "window"
-#the featuee embedding that is used. Options are "lda", "tfidf" and "lsa"
-model = "lda"
-#if using tfidf-space as embedding, this specifies if inverse document frrequency-weighting is applied
-idf = True
-#if true, feature-wise similarity measure is used
-feature_wise = False
-#when using topic model (lsa or lda), this specifies the number of topics
-n_dims = 5
-#specifies if the regression model is fit with intercept
-with_intercept = False
-#specifies if cov-matrix is standardized by subtracting the mean covariance
-standardize_cov_matrix = True
-#if true, the model predicts correlation, not covariance. Only works with model trained on whole sample, not window
-predict_corr = False
-#the weight applied to the estimation generated from model when using the ensemble of model and lw-estimator
-ensemble_weight = 0.1
-#name of the files in which results are saved
-trial_name = "lda5dim_cov_standardize_horizon2Q_daily_window_ensemble0.1"
-
-# loading data
-df_reports = pd.read_csv("data/reports_with_duplicates_final.csv", dtype="string", index_col="date")
-df_reports.index = pd.to_datetime(df_reports.index)
-if frequency == "daily":
-    df_returns = pd.read_csv("data/stock_returns.csv", index_col="Date")
-if frequency == "weekly":
-    df_returns = pd.read_csv("data/stock_returns_weekly.csv", index_col="Date")
-
-df_returns.index = pd.to_datetime(df_returns.index)
-
-# defining train test split
-train_first = datetime(year=2005, month=12, day=31)
-if mode == "eval":
-    train_last = datetime(year=2016, month=9, day=30)
-if mode == "test":
-    train_last = datetime(year=2018, month=9, day=30)
-
-if model == "tfidf":
-    # string with pickle name for saved model
-    if idf:
-        weighting = "tfidf"
-    else:
-        weighting = "tf"
-    pickle_name = "vectorizer_{}.p".format(weighting)
-    # checking if model has been saved
-    if os.path.isfile(pickle_name):
-        vectorizer = pickle.load(open(pickle_name, "rb"))
-    else:
-        vectorizer = train_tfidf_model(df_reports, train_last, idf)
-        pickle.dump(vectorizer, open(pickle_name, "wb"))
+def train_whole_sample_model(params, report_store, returns_panel, availability, feature_store, train_first,
+                             train_last):
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
 
-if model in ["svd", "lda"]:
-    # string with name for pickle to save model to
-    pickle_name = "vectorizer_{model}_tuple_{dim}.p".format(model=model, dim=n_dims)
+    time_horizon_quarters = params["time_horizon_quarters"]
+    feature_wise = params["feature_wise"]
+    standardize_cov_matrix = params["standardize_cov_matrix"]
+    predict_corr = params["predict_corr"]
 
-    if os.path.isfile(pickle_name):
-        vectorizer, topic_model = pickle.load(open(pickle_name, "rb"))
-    else:
-        if model == "svd":
-            vectorizer, topic_model = train_svd_model(df_reports, train_last, n_dims)
-        else:
-            vectorizer, topic_model = train_lda_model(df_reports, train_last, n_dims)
-        pickle.dump((vectorizer, topic_model), open(pickle_name, "wb"))
+    # loading reports for training set
+    train_range = report_store.dates_between(train_first, train_last)
 
-# loading reports for training set
-df_reports_train = df_reports.loc[train_first:train_last]
-train_range = df_reports_train.index
+    train_x = []
+    train_y = []
+    rolling_cov = RollingCovariance(returns_panel)
 
-train_x = []
-train_y = []
-mean_sims = []
-
-if model_train_sample == "whole":
     for date in train_range:
 
         returns_stop = date + QuarterEnd(startingMonth=3, n=time_horizon_quarters)
@@ -401,20 +319,16 @@ if model_train_sample == "whole":
         print(date + pd.DateOffset(days=1))
         print(returns_stop)
 
-        #loading reports and returns for period, finding the companies in which both datapoints exist
-        reports = get_reports_for_date(df_reports, date)
-        returns = get_returns_for_period(df_returns, date + pd.DateOffset(days=1), returns_stop)
-        returns, reports = find_column_intersection([returns, reports])
+        #finding the companies in which both datapoints exist, loading reports for period
+        companies = availability.window([date], [(date + pd.DateOffset(days=1), returns_stop)])
+        reports = get_reports_for_date(report_store, date, availability.companies[companies])
 
-        #covariance and correlation matrix for period
-        cov = predict_cov_sample(returns)
-        cor = predict_cov_sample(returns, True)
+        #covariance and correlation matrix for period, overlapping periods share their quarters
+        rolling_cov.move_to(date + pd.DateOffset(days=1), returns_stop)
+        cov, cor = rolling_cov.covariance(availability.returns_columns[companies])
 
         #feature engineering
-        if model == "tfidf":
-            reports_features = tfidf_features(reports, vectorizer)
-        if model in ["svd", "lda"]:
-            reports_features = topic_model_features(reports, vectorizer, topic_model)
+        reports_features = feature_store.features(reports)
 
         if predict_corr:
             est_target = cor
@@ -448,201 +362,137 @@ if model_train_sample == "whole":
     train_x = scaler.fit_transform(train_x)
 
     # regression model for prediction
-    lr = LinearRegression(fit_intercept=with_intercept)
+    lr = LinearRegression(fit_intercept=params["with_intercept"])
     lr.fit(train_x, train_y)
 
-# mean variance in the sample, as model doesn't predict variance
-#sample_mean_var = np.mean(mean_covs)
+    return lr, scaler
 
-# the following is to test to trained model
-total_quarters = 8
-test_intervals = int(total_quarters / time_horizon_quarters)
 
-#initializing empty numpy arrays to save returns to
-r_equal = np.array([])
-r_constant = np.array([])
-r_sample = np.array([])
-r_lw = np.array([])
-r_model = np.array([])
-r_combined = np.array([])
+def whole_sample_model_estimator(params, lr, scaler):
+    # the regression model trained on the whole sample, applied to the reports before the out of sample period
+    def estimate(window, estimates):
+        reports_features = window.features(out_of_sample=True)
+        if params["predict_corr"]:
+            return predict_correlation_matrix_model(lr, scaler, reports_features, mean_off_diagonal(window.cor),
+                                                    params["feature_wise"], params["standardize_cov_matrix"],
+                                                    window.cov)
 
-#this is for saving the results
-frob_rows = []
-df_columns = ["equal", "constant", "sample", "lw", "model", "combined"]
-df_index = []
-var_rows = []
+        return predict_covariance_matrix_model(lr, scaler, reports_features, np.diagonal(window.cov).mean(),
+                                               mean_off_diagonal(window.cov), params["feature_wise"],
+                                               params["standardize_cov_matrix"])
 
-#testing the model
-for i in range(test_intervals):
+    return estimate
 
-    if mode == "eval":
-        y = 2016
-    if mode == "test":
-        y = 2018
-    sample_start = datetime(year=y, month=1, day=1) + QuarterBegin(startingMonth=1, n=i * time_horizon_quarters)
-    sample_stop = sample_start + DateOffset(years=1) - DateOffset(days=1)
 
-    out_of_sample_start = sample_stop + DateOffset(days=1)
-    out_of_sample_stop = out_of_sample_start + QuarterEnd(startingMonth=3, n=time_horizon_quarters)
+def window_model_estimator(window, estimates):
+    # the model fit on the sample window only
+    return predict_cov_window_model(window.cov, window.features(), window.features(out_of_sample=True))
 
-    # creating the reports and returns for the test.
-    # Includes sample (previous time frame used for empirical estimation) and the test set
-    returns_sample = get_returns_for_period(df_returns, sample_start, sample_stop)
-    returns_out_of_sample = get_returns_for_period(df_returns, out_of_sample_start, out_of_sample_stop)
 
-    reports_sample = get_reports_for_date(df_reports, sample_start - Timedelta(days=1))
-    reports_out_of_sample = get_reports_for_date(df_reports, out_of_sample_start - Timedelta(days=1))
+def trial_estimators(params, report_store, returns_panel, availability, feature_store, train_last):
+    # the baselines (all covariance values equal, constant correlation, sample and ledoit-wolf), the model of
+    # the trial and the weighted average of the model and ledoit-wolf estimates
+    if params["model_train_sample"] == "whole":
+        lr, scaler = train_whole_sample_model(params, report_store, returns_panel, availability, feature_store,
+                                              TRAIN_FIRST, train_last)
+        model = whole_sample_model_estimator(params, lr, scaler)
+    if params["model_train_sample"] == "window":
+        model = window_model_estimator
 
-    print("-----------------new test period-----------------")
-    print("reports for: " + str(out_of_sample_start - Timedelta(days=1)))
+    return dict(BASELINE_ESTIMATORS, model=model, combined=ensemble_estimator(params["ensemble_weight"], "model", "lw"))
 
-    returns_sample, returns_out_of_sample, reports_sample, reports_out_of_sample = find_column_intersection(
-        [returns_sample, returns_out_of_sample, reports_sample, reports_out_of_sample])
 
-    # feature engineer for the time frame to predict
-    if model == "tfidf":
-        reports_features_out_of_sample = tfidf_features(reports_out_of_sample, vectorizer)
-    if model in ["svd", "lda"]:
-        reports_features_out_of_sample = topic_model_features(reports_out_of_sample, vectorizer, topic_model)
+def trial_period(params):
+    # first and last day of the test sample, and the end of the training sample of the models
+    if params["mode"] == "eval":
+        test_start = datetime(year=2017, month=1, day=1)
+    if params["mode"] == "test":
+        test_start = datetime(year=2019, month=1, day=1)
+    test_stop = test_start + QuarterEnd(startingMonth=3, n=params["test_quarters"])
 
-    # different covariance matrix predictions
-    cov_sample = predict_cov_sample(returns_sample)
-    cor_sample = predict_cov_sample(returns_sample, True)
+    return test_start, test_stop, training_cutoff(test_start)
 
-    cov_upper = cov_sample[np.triu_indices(cov_sample.shape[0], k=1)]
-    cor_upper = cor_sample[np.triu_indices(cor_sample.shape[0], k=1)]
-    sample_mean_cov = cov_upper.mean()
-    sample_mean_cor = cor_upper.mean()
-    sample_mean_var = np.diagonal(cov_sample).mean()
 
-    if model_train_sample == "whole":
-        if predict_corr:
-            cov_model = predict_correlation_matrix_model(lr, scaler, reports_features_out_of_sample, sample_mean_cor,
-                                                         feature_wise, standardize_cov_matrix, cov_sample)
-        else:
-            cov_model = predict_covariance_matrix_model(lr, scaler, reports_features_out_of_sample, sample_mean_var,
-                                                        sample_mean_cov, feature_wise, standardize_cov_matrix)
+def training_cutoff(test_start):
+    # the models are trained on the reports up to a quarter before the test sample
+    return pd.Timestamp(test_start) - DateOffset(months=3) - DateOffset(days=1)
+
+
+def run_walk_forward(params, report_store, returns_panel, test_start, test_stop, train_last, registry=None,
+                     workers=1):
+    # frobenius errors (window x estimator) and the BacktestAccumulator of the realized returns of the
+    # estimators of a trial, over the windows of [test_start, test_stop]
+    if registry is None:
+        registry = ModelRegistry("models")
+
+    feature_store = load_models(params, report_store, train_last, registry)
+    availability = AvailabilityIndex(report_store, returns_panel)
+    estimators = trial_estimators(params, report_store, returns_panel, availability, feature_store, train_last)
+
+    engine = WalkForward(report_store, returns_panel, estimators, feature_store, availability)
+    windows = walk_forward_windows(test_start, test_stop, params["sample_quarters"], params["time_horizon_quarters"])
+
+    return engine.run(windows, workers)
+
+
+def run_trial(params, report_store, returns_panel, registry=None, workers=1):
+    params = dict(default_params, **params)
+    ensemble_weight = params["ensemble_weight"]
+    trial_name = params["trial_name"] or make_trial_name(params)
+
+    test_start, test_stop, train_last = trial_period(params)
+    df_frob, backtest = run_walk_forward(params, report_store, returns_panel, test_start, test_stop, train_last,
+                                         registry, workers)
+
+    df_frob.loc["all"] = df_frob.mean(axis=0)
+    df_frob["impr_model"] = (df_frob["model"]/df_frob["equal"]) - 1
+    df_frob["impr_comb"] = (df_frob["combined"]/df_frob["equal"]) - 1
+
+    print(df_frob)
+
+    df_stats = backtest.statistics(252 if params["frequency"] == "daily" else 52)
+    print(df_stats)
+
+    df_var = backtest.window_std()
+    df_var.loc["mean"] = df_var.mean(axis=0)
+    df_var.loc["whole"] = df_stats["std"]
+    df_var["impr_model"] = (df_var["model"]/df_var["equal"]) - 1
+    df_var["impr_comb"] = (df_var["combined"]/df_var["equal"]) - 1
+
+    print(df_var)
+
+    print("improvement in variance of returns through ensemble at weight of " + str(ensemble_weight) + ":")
+    print(df_var.loc["whole", "impr_comb"])
+
+    df_wealth = backtest.wealth(100)
+    port_r_equal = df_wealth["equal"].values
+    port_r_model = df_wealth["combined"].values
+
+    df_frob.to_csv("results/frob_" + trial_name + ".csv", sep=";")
+    df_var.to_csv("results/std_" + trial_name + ".csv", sep=";")
+    df_stats.to_csv("results/stats_" + trial_name + ".csv", sep=";")
+
+    return df_frob, df_var, port_r_equal, port_r_model
+
+
+def plot_returns(port_r_equal, port_r_model, path):
+    # plotting the returns to a file, without a display
+    from matplotlib.figure import Figure
 
-    if model_train_sample == "window":
-        # feature engineer for the sample window
-        if model == "tfidf":
-            reports_features_sample = tfidf_features(reports_sample, vectorizer)
-        if model in ["svd", "lda"]:
-            reports_features_sample = topic_model_features(reports_sample, vectorizer, topic_model)
+    figure = Figure()
+    ax = figure.subplots()
+    x = range(len(port_r_equal))
+    ax.plot(x, port_r_equal, label="equal")
+    ax.plot(x, port_r_model, label="model")
 
-        cov_model = predict_cov_window_model(cov_sample, reports_features_sample, reports_features_out_of_sample)
+    ax.legend()
+    ax.set_xlabel("trading days")
+    ax.set_ylabel("portfolio value")
+    figure.savefig(path)
 
-    #covariance estimate on assumption that all covariance values are equal
-    cov_equal = np.full(cov_sample.shape, sample_mean_cov)
-    np.fill_diagonal(cov_equal, sample_mean_var)
-
-    #estimates from constant covariance model (
-    cov_constant = constant_covariance_model(cov_sample, sample_mean_cor)
-
-    #estimates from ledoit-wolf estimator
-    LW = LedoitWolf()
-    cov_lw = LW.fit(returns_sample).covariance_
-
-    #weighted average of the estimation from the model and the sample covariance matrix
-    cov_combined = ensemble_weight * cov_model + (1 - ensemble_weight) * cov_lw
-
-    # empirical variance for the out of sample time frame
-    cov_true = compute_cov_matrix(returns_out_of_sample)
-
-    #the frobernius error norms for different estimates
-    frob_results_line = [np.linalg.norm(cov_true - cov_equal, ord="fro"),
-                         np.linalg.norm(cov_true - cov_constant, ord="fro"),
-                         np.linalg.norm(cov_true - cov_sample, ord="fro"), np.linalg.norm(cov_true - cov_lw, ord="fro"),
-                         np.linalg.norm(cov_true - cov_model, ord="fro"),
-                         np.linalg.norm(cov_true - cov_combined, ord="fro")]
-
-    df_index.append(sample_stop)
-    frob_rows.append(frob_results_line)
-
-    # evaluation of the predictions
-    print("--------eval-------- ")
-
-    print("frobenius norm for cov equal")
-    print(frob_results_line[0])
-
-    print("frobenius norm for cov constant")
-    print(frob_results_line[1])
-
-    print("frobenius norm for sample cov")
-    print(frob_results_line[2])
-
-    print("frobenius norm for ledoit wolf estimator")
-    print(frob_results_line[3])
-
-    print("frobenius norm using nlu model on risk reports")
-    print(frob_results_line[4])
-
-    print("frobenius norm of combined estimates of lw and model")
-    print(frob_results_line[5])
-
-    # constructing portfolios based on predictions
-    w_equal = optimal_portfolio_weights(cov_equal)
-    w_constant = optimal_portfolio_weights(cov_constant)
-    w_sample = optimal_portfolio_weights(cov_sample)
-    w_lw = optimal_portfolio_weights(cov_lw)
-    w_model = optimal_portfolio_weights(cov_model)
-    w_combined = optimal_portfolio_weights(cov_combined)
-
-    # calculating realized returns based on these portfolios
-    print("-----compute returns----")
-
-    print("equal cov portfolio")
-    r_equal, r_equal_var = realized_portfolio_returns(returns_out_of_sample.values, w_equal, r_equal)
-    print("constant cov portfolio")
-    r_constant, r_constant_var = realized_portfolio_returns(returns_out_of_sample.values, w_constant, r_constant)
-    print("sample cov portfolio")
-    r_sample, r_sample_var = realized_portfolio_returns(returns_out_of_sample.values, w_sample, r_sample)
-    print("ledoit wolf cov portfolio")
-    r_lw, r_lw_var = realized_portfolio_returns(returns_out_of_sample.values, w_lw, r_lw)
-    print("model cov portfolio")
-    r_model, r_model_var = realized_portfolio_returns(returns_out_of_sample.values, w_model, r_model)
-    print("combined cov portfolio")
-    r_combined, r_combined_var = realized_portfolio_returns(returns_out_of_sample.values, w_combined, r_combined)
-
-    var_line = [r_equal_var, r_constant_var, r_sample_var, r_lw_var, r_model_var, r_combined_var]
-    var_rows.append(var_line)
-
-df_frob = pd.DataFrame(frob_rows, columns=df_columns, index=df_index)
-df_frob.loc["all"] = df_frob.mean(axis=0)
-df_frob["impr_model"] = (df_frob["model"]/df_frob["equal"]) - 1
-df_frob["impr_comb"] = (df_frob["combined"]/df_frob["equal"]) - 1
-
-print(df_frob)
-
-std_whole = [r_equal.std(), r_constant.std(), r_sample.std(), r_lw.std(), r_model.std(), r_combined.std()]
-df_var = pd.DataFrame(var_rows, columns=df_columns, index=df_index)
-df_var.loc["mean"] = df_var.mean(axis=0)
-df_var.loc["whole"] = std_whole
-df_var["impr_model"] = (df_var["model"]/df_var["equal"]) - 1
-df_var["impr_comb"] = (df_var["combined"]/df_var["equal"]) - 1
-
-print(df_var)
-
-print("improvement in variance of returns through ensemble at weight of " + str(ensemble_weight) + ":")
-print(df_var.loc["whole", "impr_comb"])
-
-port_r_equal = realize_returns(100, r_equal)
-port_r_model = realize_returns(100, r_combined)
 
-df_frob.to_csv("results/frob_" + trial_name + ".csv", sep=";")
-df_var.to_csv("results/std_" + trial_name + ".csv", sep=";")
+if __name__ == "__main__":
+    report_store, returns_panel = load_data(default_params["frequency"])
+    df_frob, df_var, port_r_equal, port_r_model = run_trial(default_params, report_store, returns_panel)
 
-# plotting the returns
-x = range(len(port_r_equal))
-plt.plot(x, port_r_equal, label="equal")
-# plt.plot(x, r_sample, label="sample")
-#plt.plot(x, r_lw, label="ledoit wolf")
-# plt.plot(x, r_model, label="lda model")
-plt.plot(x, port_r_model, label="model")
-
-plt.legend()
-plt.xlabel("trading days")
-plt.ylabel("portfolio value")
-
-#plt.savefig("realized.png")
-plt.show()
+    plot_returns(port_r_equal, port_r_model, "results/realized_" + make_trial_name(default_params) + ".png")
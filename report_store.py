@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from model_registry import corpus_hash
+
+# the reports are stored in two files:
+# segments.arrow - uncompressed arrow ipc file with one distinct text segment per row (memory-mapped on load)
+# index.parquet - one row per (date, company) with the list of segment row numbers that make up the report.
+# a quarterly report is the 10-K segment followed by the segments of the 10-Qs filed since, so the
+# text of a 10-K is stored once no matter how many quarters build on it.
+SEGMENT_FILE = "segments.arrow"
+INDEX_FILE = "index.parquet"
+SEGMENT_SCHEMA = pa.schema([("text", pa.large_string())])
+BATCH_SIZE = 256
+
+
+class ReportStoreWriter:
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_ids = {}
+        self.batch = []
+        self.dates = []
+        self.companies = []
+        self.segments = []
+
+        self.sink = pa.OSFile(os.path.join(path, SEGMENT_FILE), "wb")
+        self.writer = pa.ipc.new_file(self.sink, SEGMENT_SCHEMA)
+
+    def _flush(self):
+        if len(self.batch) > 0:
+            self.writer.write_batch(pa.record_batch([pa.array(self.batch, pa.large_string())], schema=SEGMENT_SCHEMA))
+            self.batch = []
+
+    def segment_id(self, text):
+        # every distinct segment is written once
+        digest = hashlib.sha1(text.encode("utf-8", errors="surrogatepass")).digest()
+        if digest not in self.segment_ids:
+            self.segment_ids[digest] = len(self.segment_ids)
+            self.batch.append(text)
+            if len(self.batch) >= BATCH_SIZE:
+                self._flush()
+
+        return self.segment_ids[digest]
+
+    def add(self, date, company, segments):
+        self.dates.append(date)
+        self.companies.append(company)
+        self.segments.append([self.segment_id(text) for text in segments])
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        self.sink.close()
+
+        df_index = pd.DataFrame({"date": pd.to_datetime(self.dates), "company": self.companies,
+                                 "segments": self.segments})
+        # sorted by date, companies keep the order in which they were added
+        df_index = df_index.sort_values("date", kind="stable")
+        pq.write_table(pa.Table.from_pandas(df_index, preserve_index=False), os.path.join(self.path, INDEX_FILE))
+
+        print("stored {} reports as {} distinct segments.".format(len(self.dates), len(self.segment_ids)))
+
+
+def build_report_store(csv_file, path, chunksize=8):
+    writer = ReportStoreWriter(path)
+
+    # the csv is read a few dates at a time, every report becomes a single segment
+    for chunk in pd.read_csv(csv_file, dtype="string", index_col="date", chunksize=chunksize):
+        chunk.index = pd.to_datetime(chunk.index)
+        for date, row in chunk.iterrows():
+            for company, text in row.dropna().items():
+                writer.add(date, company, [text])
+
+    writer.close()
+
+
+class ReportStore:
+    # read access to a store written by ReportStoreWriter. only the index is loaded into memory,
+    # the texts are read from the memory-mapped segment file when they are requested
+
+    def __init__(self, path):
+        self.path = path
+        source = pa.memory_map(os.path.join(path, SEGMENT_FILE), "r")
+        self.segments = pa.ipc.open_file(source).read_all().column("text")
+
+        self.index = pq.read_table(os.path.join(path, INDEX_FILE)).to_pandas()
+        self.index["segments"] = [tuple(segments) for segments in self.index["segments"]]
+        self.dates = pd.DatetimeIndex(self.index["date"].unique())
+
+    def segment_texts(self, segment_ids):
+        return self.segments.take(pa.array(segment_ids, pa.int64())).to_pylist()
+
+    def document_text(self, segments):
+        return "".join(self.segment_texts(list(segments)))
+
+    def dates_between(self, first, last):
+        return self.dates[(self.dates >= first) & (self.dates <= last)]
+
+    def reports_for_date(self, date, companies=None):
+        # one row with a tuple of segment ids per company, the text is only read when it is needed.
+        # companies selects the columns and their order
+        rows = self.index[self.index["date"] == pd.Timestamp(date)]
+        if companies is None:
+            companies = list(rows["company"])
+            segments = list(rows["segments"])
+        else:
+            by_company = dict(zip(rows["company"], rows["segments"]))
+            segments = [by_company[company] for company in companies]
+
+        return pd.DataFrame([segments], index=pd.DatetimeIndex([date], name="date"), columns=list(companies),
+                            dtype=object)
+
+    def corpus_documents(self, last):
+        # all reports up to last, in the same (date, company) order as the wide reports csv
+        rows = self.index[self.index["date"] <= pd.Timestamp(last)]
+
+        return list(rows["segments"])
+
+    def _corpus_parts(self, documents):
+        yield str(documents)
+
+        segment_ids = sorted({segment for document in documents for segment in document})
+        for start in range(0, len(segment_ids), BATCH_SIZE):
+            yield from self.segment_texts(segment_ids[start:start + BATCH_SIZE])
+
+    def corpus_hash(self, last):
+        return corpus_hash(self._corpus_parts(self.corpus_documents(last)))
+
+
+def load_report_store(path, csv_file):
+    if not os.path.isfile(os.path.join(path, INDEX_FILE)):
+        build_report_store(csv_file, path)
+
+    return ReportStore(path)
+
+
+if __name__ == "__main__":
+    build_report_store("data/reports_with_duplicates_final.csv", "data/reports_with_duplicates_store")
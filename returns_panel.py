@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pandas as pd
+from file_utils import atomic_write
+
+# a returns panel is stored as plain .npy files in one directory:
+# companies.npy - the column names, shared by all frequencies
+# <frequency>_dates.npy - datetime64 row index
+# <frequency>_returns.npy - float64 returns, one row per date and one column per company, NaN where missing
+# <frequency>_valid.npy - bitmap of the returns that are not missing, eight stocks per byte
+
+
+def _atomic_save(path, array):
+    atomic_write(path, lambda f: np.save(f, array))
+
+
+def save_returns_panel(path, frequency, dates, companies, returns):
+    os.makedirs(path, exist_ok=True)
+
+    _atomic_save(os.path.join(path, "companies.npy"), np.asarray(companies, dtype=str))
+    _atomic_save(os.path.join(path, frequency + "_dates.npy"), np.asarray(dates, dtype="datetime64[ns]"))
+    _atomic_save(os.path.join(path, frequency + "_valid.npy"), np.packbits(~np.isnan(returns), axis=1))
+    _atomic_save(os.path.join(path, frequency + "_returns.npy"), np.asarray(returns, dtype=np.float64))
+
+
+def has_returns_panel(path, frequency):
+    return os.path.isfile(os.path.join(path, frequency + "_returns.npy"))
+
+
+class ReturnsPanel:
+    # returns of all stocks with a validity bitmap. a period is a view on the rows of the returns, the
+    # stocks without missing returns in it are found from prefix counts of missing returns instead
+    # of a scan of the period
+
+    def __init__(self, dates, companies, returns, valid=None):
+        self.dates = pd.DatetimeIndex(dates, name="Date")
+        self.companies = np.asarray(companies)
+        self.returns = returns
+        self.valid = ~np.isnan(returns) if valid is None else valid
+
+        # missing[i, j] is the number of missing returns of stock j in the rows before row i
+        self.missing = np.zeros((len(self.dates) + 1, len(self.companies)), dtype=np.int32)
+        np.cumsum(~self.valid, axis=0, dtype=np.int32, out=self.missing[1:])
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(pd.to_datetime(df.index), df.columns, df.to_numpy(dtype=np.float64))
+
+    def rows(self, start, stop):
+        # first and last + 1 row between start and stop, both included like .loc
+        first = self.dates.searchsorted(pd.Timestamp(start), "left")
+        last = self.dates.searchsorted(pd.Timestamp(stop), "right")
+
+        return first, last
+
+    def complete_columns(self, start, stop):
+        first, last = self.rows(start, stop)
+
+        return np.flatnonzero(self.missing[last] == self.missing[first])
+
+    def period(self, start, stop, columns=None):
+        # the returns from start to stop of the given columns, by default of the stocks that have no missing
+        # returns in the period. the values are copied only when stocks have to be left out
+        first, last = self.rows(start, stop)
+        if columns is None:
+            columns = np.flatnonzero(self.missing[last] == self.missing[first])
+
+        values = self.returns[first:last]
+        if len(columns) < len(self.companies) or np.any(columns != np.arange(len(self.companies))):
+            values = values[:, columns]
+
+        return pd.DataFrame(values, index=self.dates[first:last], columns=self.companies[columns], copy=False)
+
+
+def load_returns_panel(path, frequency):
+    # the returns are memory-mapped, periods are views on the file
+    companies = np.load(os.path.join(path, "companies.npy"))
+    dates = np.load(os.path.join(path, frequency + "_dates.npy"))
+    returns = np.load(os.path.join(path, frequency + "_returns.npy"), mmap_mode="r")
+
+    valid = None
+    valid_path = os.path.join(path, frequency + "_valid.npy")
+    if os.path.isfile(valid_path):
+        valid = np.unpackbits(np.load(valid_path), axis=1, count=len(companies)).astype(bool)
+
+    return ReturnsPanel(dates, companies, returns, valid)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# covariance windows are moved a quarter at a time, so a window is kept as the sum of per-quarter statistics.
+# moving a window by one quarter costs one quarter of returns (O(dT n^2)) instead of the whole window
+
+
+def quarter_ranges(start, stop):
+    # [start, stop] split at the ends of calendar quarters
+    ranges = []
+    start = pd.Timestamp(start)
+    stop = pd.Timestamp(stop)
+    while start <= stop:
+        quarter_end = start + pd.offsets.QuarterEnd(startingMonth=3, n=0)
+        ranges.append((start, min(quarter_end, stop)))
+        start = quarter_end + pd.Timedelta(days=1)
+
+    return ranges
+
+
+class RollingCovariance:
+    # running row count, sums and cross-products of the returns in a window over all columns of a returns
+    # panel, with missing returns counted as zero. the statistics of the stocks that have no missing returns
+    # in the window are exact, so every window can use a different set of stocks
+
+    def __init__(self, returns_panel):
+        self.returns_panel = returns_panel
+        n = len(returns_panel.companies)
+        self.blocks = {}
+        self.count = 0
+        self.sums = np.zeros(n)
+        self.products = np.zeros((n, n))
+
+    def _block_statistics(self, first, last):
+        values = np.nan_to_num(np.asarray(self.returns_panel.returns[first:last], dtype=np.float64))
+
+        return last - first, values.sum(axis=0), values.T @ values
+
+    def add(self, start, stop):
+        rows = self.returns_panel.rows(start, stop)
+        count, sums, products = self._block_statistics(*rows)
+        self.blocks[rows] = (count, sums, products)
+        self.count += count
+        self.sums += sums
+        self.products += products
+
+    def remove(self, rows):
+        count, sums, products = self.blocks.pop(rows)
+        self.count -= count
+        self.sums -= sums
+        self.products -= products
+
+    def move_to(self, start, stop):
+        # the window becomes [start, stop], only the quarters that enter or leave it are touched
+        ranges = {self.returns_panel.rows(first, last): (first, last) for first, last in quarter_ranges(start, stop)}
+
+        for rows in [rows for rows in self.blocks if rows not in ranges]:
+            self.remove(rows)
+        if len(self.blocks) == 0:
+            # a window without overlap starts from zero instead of carrying the rounding errors of the last one
+            self.sums[:] = 0
+            self.products[:] = 0
+
+        for rows, (first, last) in ranges.items():
+            if rows not in self.blocks:
+                self.add(first, last)
+
+    def covariance(self, columns):
+        # sample covariance (ddof 1, like np.cov) and correlation of the given panel columns
+        sums = self.sums[columns]
+        cov = (self.products[np.ix_(columns, columns)] - np.outer(sums, sums) / self.count) / (self.count - 1)
+
+        std = np.sqrt(np.diagonal(cov))
+        cor = np.clip(cov / np.outer(std, std), -1, 1)
+        np.fill_diagonal(cor, 1.0)
+
+        return cov, cor
@@ -1,26 +1,52 @@
-from edgar import Edgar, Company
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from edgar_client import EdgarClient, OfflineEdgarClient
+from filing_cache import FilingCache
+from functools import lru_cache
+from lxml import etree
 import pandas as pd
+import io
+import multiprocessing
 import os
-import pickle
+import re
 
 companies = "data/companies.csv"
-edgar = Edgar()
 df_companies = pd.read_csv(companies, sep=";")
 
 companies_unique = df_companies["company"].dropna().unique()
 
-def is_item_header(nr, title, text, prev, title_key_word):
-    bare_len = len("item " + nr + title)
+HEADER_STRIP_PATTERN = re.compile(r"&nbsp;|[. \n\xa0]")
+# short text nodes with one of these words are headers, page footers or the table of contents
+SKIP_WORDS = ["index", "contents", "item", "factor", "summary", "form", "inc"]
+# filings are fed to the parser in chunks, so parsing stops shortly after the end of the risk factors
+PARSE_CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=256)
+def header_key(text):
+    # a candidate header is checked against several items, it is normalized only once
+    return HEADER_STRIP_PATTERN.sub("", text).lower()
 
-    for c in ["&nbsp;", ".", " ", "\n", "\xa0"]:
-        text = text.replace(c, "")
 
+class PreviousNode:
+    # the text node before a candidate header. every header check looks at it, so it is normalized once
+    # when the extractor moves past it
 
-    text = text.lower()
+    def __init__(self, text):
+        self.text = text
+        self.lower = text.lower()
+        bare = text.replace("&nbsp;", "")
+        self.length = len(bare)
+        self.stripped_length = len(bare.strip())
+
+
+def is_item_header(nr, title, text, prev, title_key_word):
+    bare_len = len("item " + nr + title)
+
+    text = header_key(text)
 
     length = len(text)
 
-    if nr in text and length < len(nr) + 2 and "item" in prev.lower() and len(prev.replace("&nbsp;", "")) < 10:
+    if nr in text and length < len(nr) + 2 and "item" in prev.lower and prev.length < 10:
         return True
 
     if length < len("item " + nr) + 4:
@@ -41,7 +67,7 @@ def is_item_header(nr, title, text, prev, title_key_word):
 
 
 def is_item_1a_header(text, prev):
-    if len(text) == 1 and "A" in text and "1" in prev and len(prev.replace("&nbsp;", "").strip()) < 10:
+    if len(text) == 1 and "A" in text and "1" in prev.text and prev.stripped_length < 10:
         return True
 
     if ("1A" in text or "1a" in text) and len(text) < 200:
@@ -50,7 +76,7 @@ def is_item_1a_header(text, prev):
 
 
 def is_item_1b_header(text, prev):
-    if len(text) == 1 and "B" in text and "1" in prev and len(prev.replace("&nbsp;", "").strip()) < 10 :
+    if len(text) == 1 and "B" in text and "1" in prev.text and prev.stripped_length < 10:
         return True
     if ("1B" in text or "1b" in text) and len(text) < 250:
         return is_item_header("1b", "unresolved staff comments", text, prev, ["unresolved", "staff", "comments"])
@@ -60,7 +86,7 @@ def is_item_1b_header(text, prev):
 
 def is_10q_item_2_header(text, prev):
     if "2" in text and len(text) < 250:
-        if len(text) < 3 and  "tem" in prev.lower() and len(prev.replace("&nbsp;", "").strip()) < 10:
+        if len(text) < 3 and "tem" in prev.lower and prev.stripped_length < 10:
             #print("on prev: "+ prev)
             return True
         return is_item_header("2", "unregistered sales of equity sequrities and use of proceeds", text, prev, ["unregistered", "sales", "equity", "securities", "proceeds"]) \
@@ -70,15 +96,15 @@ def is_10q_item_2_header(text, prev):
 
 def is_10k_item_2_header(text, prev):
     if "2" in text and len(text) < 200:
-        if len(text) < 3 and  "tem" in prev.lower() and len(prev.replace("&nbsp;", "").strip()) < 10:
-            print("on prev: " + prev)
+        if len(text) < 3 and "tem" in prev.lower and prev.stripped_length < 10:
+            print("on prev: " + prev.text)
             return True
         return is_item_header("2", "properties", text, prev, ["properties"])
     return False
 
 def is_item_6_header(text, prev):
     if "6" in text and len(text) < 250:
-        if len(text) < 3 and  "tem" in prev.lower() and len(prev.replace("&nbsp;", "").strip()) < 10:
+        if len(text) < 3 and "tem" in prev.lower and prev.stripped_length < 10:
             return True
         return is_item_header("6", "exhibits", text, prev, ["exhibits"]) or \
                is_item_header("6", "exhibits and reports on form 8-k", text, prev, ["exhibits", "reports", "form"]) or \
@@ -90,165 +116,169 @@ def print_filing(tuple):
   print(str(not tuple[3]) + " " + tuple[0] + " - " + tuple[1] + " -" + tuple[2][:250])
 
 
-def parse_10q_filing(company, doc_lxml, doc):
-    text_elem = doc_lxml.xpath("//text()")
+def is_10q_section_end(text, prev):
+    return is_item_1b_header(text, prev) or is_10q_item_2_header(text, prev) or is_item_6_header(text, prev)
 
-    fromhere = False
-    current_text = ""
-    risk_factors_text = []
 
-    # print(text_elem)
-    prev = ""
+def is_10k_section_end(text, prev):
+    return is_item_1b_header(text, prev) or is_10k_item_2_header(text, prev)
 
-    for text in text_elem:
-        if fromhere:
-            if is_item_1b_header(text, prev) or is_10q_item_2_header(text, prev) or is_item_6_header(text, prev):
-                fromhere = False
-                if len(risk_factors_text) > 10:
 
-                    #print("got item 2 or 1b and has text!")
-                    break
-                #else:
-                #    print("got next item but no text!")
-            text = text.replace("\n", " ").replace("\xa0", " ").strip()
-            if fromhere and len(text) > 4 and not (
-                    any(word in text.lower() for word in ["index", "contents", "item", "factor", "summary", "form", "inc"]) and len(
-                    text) < 40):
-                if text[0] in ",;:":
-                    current_text = current_text + text
-                else:
-                    current_text = current_text + " " + text
-                if text[-1] in ".!?":
-                    risk_factors_text.append(current_text + " ")
-                    current_text = ""
-        if is_item_1a_header(text, prev):
-            fromhere = True
-        prev = text
-            #print("item 1a start")
+class TextNodeTarget:
+    # parser target that joins the data events of the parser back into the text nodes of the document
+    # (the nodes of xpath("//text()"), in document order) without building the tree
 
-    text_content = "\n".join(risk_factors_text)
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.chunks = []
 
+    def _flush(self):
+        if len(self.chunks) > 0:
+            text = "".join(self.chunks)
+            self.chunks = []
+            self.on_text(text)
 
-    return (company.name, doc.content["Period of Report"], text_content, fromhere)
+    def start(self, tag, attrib):
+        self._flush()
+
+    def end(self, tag):
+        self._flush()
+
+    def data(self, data):
+        self.chunks.append(data)
+
+    def comment(self, text):
+        self._flush()
 
+    def pi(self, target, data=None):
+        self._flush()
 
-def parse_10k_filing(company, doc_lxml, doc):
-    text_elem = doc_lxml.xpath("//text()")
+    def close(self):
+        self._flush()
 
-    fromhere = False
-    current_text = ""
-    risk_factors_text = []
 
-    # print(text_elem)
-    prev = ""
+class RiskFactorExtractor:
+    # collects the sentences between the item 1a header and the header that ends the section,
+    # one text node at a time. the pieces of the current sentence are kept in a list and finished
+    # sentences are written to a buffer, so the text is copied once no matter how long it gets
 
-    for text in text_elem:
-        if fromhere:
-            if is_item_1b_header(text, prev) or is_10k_item_2_header(text, prev):
-                fromhere = False
-                if len(risk_factors_text) > 10:
-                    #print("got item 2 or 1b and has text!")
-                    break
-                #else:
-                #    print("got next item but no text!")
+    def __init__(self, is_section_end, min_length):
+        self.is_section_end = is_section_end
+        self.min_length = min_length
+        self.fromhere = False
+        self.done = False
+        self.prev = PreviousNode("")
+        self.current_text = []
+        self.risk_factors_text = io.StringIO()
+        self.n_sentences = 0
+
+    def add(self, text):
+        if self.done:
+            return
+
+        if self.fromhere:
+            if self.is_section_end(text, self.prev):
+                self.fromhere = False
+                if self.n_sentences > 10:
+                    self.done = True
+                    return
             text = text.replace("\n", " ").replace("\xa0", " ").strip()
-            if fromhere and len(text) > 3 and not (
-                    any(word in text.lower() for word in ["index", "contents", "item", "factor", "summary", "form", "inc"]) and len(
-                    text) < 40):
-                if text[0] in ",;:":
-                    current_text = current_text + text
-                else:
-                    current_text = current_text + " " + text
+            if self.fromhere and len(text) > self.min_length and not (
+                    len(text) < 40 and any(word in text.lower() for word in SKIP_WORDS)):
+                if text[0] not in ",;:":
+                    self.current_text.append(" ")
+                self.current_text.append(text)
                 if text[-1] in ".!?":
-                    risk_factors_text.append(current_text + " ")
-                    current_text = ""
-        if is_item_1a_header(text, prev):
-            fromhere = True
-        prev = text
-            #print("item 1a start")
+                    self.end_sentence()
+        if is_item_1a_header(text, self.prev):
+            self.fromhere = True
+        self.prev = PreviousNode(text)
+
+    def end_sentence(self):
+        if self.n_sentences > 0:
+            self.risk_factors_text.write("\n")
+        self.risk_factors_text.write("".join(self.current_text))
+        self.risk_factors_text.write(" ")
+        self.n_sentences += 1
+        self.current_text = []
+
+    def text(self):
+        return self.risk_factors_text.getvalue()
+
+
+def extract_risk_factors(raw, is_section_end, min_length):
+    # returns the risk factor section of a filing and whether the section end was missing
+    extractor = RiskFactorExtractor(is_section_end, min_length)
+    parser = etree.HTMLParser(target=TextNodeTarget(extractor.add))
+
+    for start in range(0, len(raw), PARSE_CHUNK_SIZE):
+        parser.feed(raw[start:start + PARSE_CHUNK_SIZE])
+        if extractor.done:
+            break
+    else:
+        parser.close()
 
-    text_content = "\n".join(risk_factors_text)
+    return extractor.text(), extractor.fromhere
 
-    return (company.name, doc.content["Period of Report"], text_content, fromhere)
 
-def get_company_by_cik(cik):
-    cik_table = str(cik)
-    length = len(cik_table)
-    cik = "0" * (10 - length) + cik_table
-    name = edgar.get_company_name_by_cik(cik)
-    company = Company(name, cik)
+def parse_filing(filing_type, raw):
+    # module level, so it can run in a parser process. only the raw filing is sent to the process
+    if filing_type == "10-K":
+        return extract_risk_factors(raw, is_10k_section_end, 3)
 
-    return company
+    return extract_risk_factors(raw, is_10q_section_end, 4)
 
-def get_filings_by_company(company, type, n):
-    tree = company.get_all_filings(filing_type=type)
-    docs_lxml = Company.get_documents(tree, no_of_documents=n)
-    docs_data = Company.get_documents(tree, no_of_documents=n, as_documents=True)
-    if not isinstance(docs_lxml, list):
-        docs_lxml = [docs_lxml]
-        docs_data = [docs_data]
 
-    return (docs_lxml, docs_data)
+def parse_10q_filing(company, doc):
+    text_content, fromhere = parse_filing("10-Q", doc.raw())
 
-def pull_company_reports(cik, ticker, c_id, start):
+    return (company.name, doc.content["Period of Report"], text_content, fromhere)
 
-    company = get_company_by_cik(cik)
-    #yearly reports first
-    filings_10k = get_filings_by_company(company, "10-K", 14)
-    if pd.Timestamp(str(filings_10k[1][-1].content["Period of Report"])) < pd.Timestamp(year=2005, month=12, day=31):
-        filings_10k = (filings_10k[0][:-1], filings_10k[1][:-1])
-    #if len(filings_10k) < 2:
-        #filings_10k = [filings_10k]
-    #check if enough
-    if pd.Timestamp(str(filings_10k[1][-1].content["Period of Report"])) > pd.Timestamp(year=2005, month=12, day=31):
-        filings_10k = get_filings_by_company(company, "10-K", 26)
 
+def parse_10k_filing(company, doc):
+    text_content, fromhere = parse_filing("10-K", doc.raw())
+
+    return (company.name, doc.content["Period of Report"], text_content, fromhere)
+
+
+def get_company_by_cik(cik, client):
+    return client.company(cik)
+
+def get_filings_by_company(company, type, start, client, parser_pool=None):
     dates = []
-    content = []
-    fromhere = []
-    has_content = []
+    parsed = []
 
-    for i in range(len(filings_10k[0])):
-        period = pd.Timestamp(str(filings_10k[1][i].content["Period of Report"]))
+    # filings come newest first, so the first one before start ends the download.
+    # with a parser pool, the next filing is downloaded while the previous ones are parsed
+    for doc in client.iter_filings(company, type):
+        period = pd.Timestamp(str(doc.content["Period of Report"]))
         if period < start:
             break
-        parsed = parse_10k_filing(company, filings_10k[0][i], filings_10k[1][i])
         dates.append(period)
-        content.append(parsed[2])
-        fromhere.append(parsed[3])
-        has_content.append(len(parsed[2]) > 0)
+        if parser_pool is None:
+            parsed.append(parse_filing(type, doc.raw()))
+        else:
+            parsed.append(parser_pool.submit(parse_filing, type, doc.raw()))
 
-    df_10k = pd.DataFrame({"content":content, "fromhere":fromhere, "has_content":has_content}, index=dates)
+    if parser_pool is not None:
+        parsed = [future.result() for future in parsed]
 
-    df_10k = check_amends(df_10k)
+    content = [text_content for text_content, _ in parsed]
+    fromhere = [section_open for _, section_open in parsed]
+    has_content = [len(text_content) > 0 for text_content in content]
 
-    #print(df_10k)
+    return pd.DataFrame({"content": content, "fromhere": fromhere, "has_content": has_content}, index=dates)
 
-    filings_10q = get_filings_by_company(company, "10-Q", 20)
-    # check if enough
-    if pd.Timestamp(str(filings_10q[1][-1].content["Period of Report"])) > pd.Timestamp(year=2005, month=12, day=31):
-        filings_10q = get_filings_by_company(company, "10-Q", 60)
-    if pd.Timestamp(str(filings_10q[1][-1].content["Period of Report"])) > pd.Timestamp(year=2005, month=12, day=31):
-        filings_10q = get_filings_by_company(company, "10-Q", 96)
+def pull_company_reports(cik, ticker, c_id, start, client, parser_pool=None):
 
-    dates = []
-    content = []
-    fromhere = []
-    has_content = []
+    company = get_company_by_cik(cik, client)
+    #yearly reports first
+    df_10k = get_filings_by_company(company, "10-K", start, client, parser_pool)
 
-    for i in range(len(filings_10q[0])):
-        period = pd.Timestamp(str(filings_10q[1][i].content["Period of Report"]))
-        if period < start:
-            break
-        parsed = parse_10q_filing(company, filings_10q[0][i], filings_10q[1][i])
-        dates.append(period)
-        content.append(parsed[2])
-        fromhere.append(parsed[3])
-        has_content.append(len(parsed[2]) > 0)
+    df_10k = check_amends(df_10k)
 
-    df_10q = pd.DataFrame({"content": content, "fromhere": fromhere, "has_content": has_content}, index=dates)
+    df_10q = get_filings_by_company(company, "10-Q", start, client, parser_pool)
 
-    #print(df_10q["content"][:250] + " ---- " + df_10q["content"][-250:])
     return (df_10k, df_10q)
 
 def check_amends(df):
@@ -265,76 +295,118 @@ def check_amends(df):
     else:
         return df
 
-def scrape(location, issues):
+def read_status_log(location):
+    # the status log has one line per scraped company: id;downloaded;seems_correct;issues
+    # later lines overwrite earlier ones, so re-scraping a company only appends to the log
+    company_status_dict = {}
+    for company_id in companies_unique:
+        company_status_dict[company_id] = [False, False]
 
     if os.path.isfile(location):
-        company_status_dict = pickle.load(open(location, "rb"))
-    else:
-        company_status_dict = {}
-        for company_id in companies_unique:
-            company_status_dict[company_id] = [False, False]
-        pickle.dump(company_status_dict, open(location, "wb"))
+        ids = {str(company_id): company_id for company_id in companies_unique}
+        with open(location) as f:
+            for line in f:
+                fields = line.rstrip("\n").split(";")
+                if len(fields) < 3 or fields[0] not in ids:
+                    continue
+                company_status_dict[ids[fields[0]]] = [fields[1] == "True", fields[2] == "True"]
 
+    return company_status_dict
+
+def scrape_company(c_id, client, parser_pool=None):
     report_file_name = "data/{ticker}_{id}_{type}.csv"
-    issues_file = issues
 
-    if os.path.isfile(issues_file):
-        list_issues = pickle.load(open(issues_file, "rb"))
+    df_to_scrape = df_companies[df_companies["company"] == c_id]
+    if len(df_to_scrape.index) > 1:
+        list_10k = []
+        list_10q = []
+        for i, row in df_to_scrape.iterrows():
+            ticker = row["ticker"]
+            company_id = row["company"]
+            df_10k, df_10q = pull_company_reports(row["cik"], ticker, company_id, pd.Timestamp(year=2005, month=12, day=31), client, parser_pool)
+            list_10k.append(df_10k)
+            list_10q.append(df_10q)
+        df_complete_10k = pd.concat(list_10k)
+        df_complete_10q = pd.concat(list_10q)
     else:
-        list_issues = []
+        row = df_to_scrape.iloc[0]
+        ticker = row["ticker"]
+        company_id = row["company"]
+        df_complete_10k, df_complete_10q = pull_company_reports(row["cik"], ticker, company_id, pd.Timestamp(year=2005, month=12, day=31), client, parser_pool)
 
-    #i = 0
 
+    seems_correct = (not ( df_complete_10k["fromhere"].any() or df_complete_10q["fromhere"].any())) and df_complete_10k["has_content"].all()
 
-    for c_id in company_status_dict:
-        #i += 1
-        #if i > 2:
-        #    break
-        if not company_status_dict[c_id][0]:
-        #if True:
-            df_to_scrape = df_companies[df_companies["company"] == c_id]
-            if len(df_to_scrape.index) > 1:
-                list_10k = []
-                list_10q = []
-                for i, row in df_to_scrape.iterrows():
-                    ticker = row["ticker"]
-                    company_id = row["company"]
-                    df_10k, df_10q = pull_company_reports(row["cik"], ticker, company_id, pd.Timestamp(year=2005, month=12, day=31))
-                    list_10k.append(df_10k)
-                    list_10q.append(df_10q)
-                df_complete_10k = pd.concat(list_10k)
-                df_complete_10q = pd.concat(list_10q)
-            else:
-                row = df_to_scrape.iloc[0]
-                ticker = row["ticker"]
-                company_id = row["company"]
-                df_complete_10k, df_complete_10q = pull_company_reports(row["cik"], ticker, company_id, pd.Timestamp(year=2005, month=12, day=31))
-
-
-            seems_correct = (not ( df_complete_10k["fromhere"].any() or df_complete_10q["fromhere"].any())) and df_complete_10k["has_content"].all()
-
-            if not seems_correct:
-
-                issues = [df_complete_10k["fromhere"].any(), df_complete_10q["fromhere"].any(), not df_complete_10k["has_content"].all()]
-                list_issues.append((company_id, issues))
-                pickle.dump(list_issues, open(issues_file, "wb"))
-
-
-            df_complete_10q.to_csv(report_file_name.format(ticker = ticker, id=company_id, type="10-Q"))
-            df_complete_10k.to_csv(report_file_name.format(ticker=ticker, id=company_id, type="10-K"))
-
-            company_status_dict[c_id][0] = True
-            company_status_dict[c_id][1] = seems_correct
-            pickle.dump(company_status_dict, open(location, "wb"))
+    issues = []
+    if not seems_correct:
+        issues = [df_complete_10k["fromhere"].any(), df_complete_10q["fromhere"].any(), not df_complete_10k["has_content"].all()]
+
+
+    df_complete_10q.to_csv(report_file_name.format(ticker = ticker, id=company_id, type="10-Q"))
+    df_complete_10k.to_csv(report_file_name.format(ticker=ticker, id=company_id, type="10-K"))
+
+    return ticker, seems_correct, issues
+
+def parser_context():
+    # parser processes are started on the first submit, from a download thread while the other threads are
+    # in the middle of requests. a forked child could inherit a lock held by one of them and deadlock, so the
+    # processes are started by a fork server (or spawned where there is none)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+
+    return multiprocessing.get_context("spawn")
+
+
+def scrape_companies(c_ids, client, workers, location, parse_workers=None):
+    # companies are downloaded by a pool of threads that hand the filings to a pool of parser processes,
+    # the status of each finished company is appended to the log
+    parser_pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=parser_context())
+    with ThreadPoolExecutor(max_workers=workers) as pool, parser_pool, open(location, "a") as status_log:
+        futures = {pool.submit(scrape_company, c_id, client, parser_pool): c_id for c_id in c_ids}
+
+        for future in as_completed(futures):
+            c_id = futures[future]
+            try:
+                ticker, seems_correct, issues = future.result()
+            except Exception as e:
+                print("scraping company {company} failed: {error}".format(company=c_id, error=e))
+                continue
+
+            status_log.write("{id};{done};{status};{issues}\n".format(id=c_id, done=True, status=seems_correct,
+                                                                      issues=",".join(str(issue) for issue in issues)))
+            status_log.flush()
             print("scraped reports for {company}. status: {status}".format(company=ticker, status=seems_correct))
 
+
+def scrape(location, workers=4, client=None, cache_root="filings_cache", parse_workers=None, user_agent=None):
+    # user_agent identifies the scraper to the sec, by default it is read from EDGAR_USER_AGENT
+    if client is None:
+        client = EdgarClient(user_agent=user_agent, cache=FilingCache(cache_root))
+
+    company_status_dict = read_status_log(location)
+
+    to_scrape = []
+    for c_id in company_status_dict:
+        if not company_status_dict[c_id][0]:
+            to_scrape.append(c_id)
         else:
             ticker = df_companies[df_companies["company"] == c_id].iloc[0]["ticker"]
             print("the reports for {} have already been downloaded.".format(ticker))
 
+    scrape_companies(to_scrape, client, workers, location, parse_workers)
 
     print("done!")
 
 
+def reparse(location, workers=4, cache_root="filings_cache", parse_workers=None):
+    # parses every company again from the filing cache, e.g. after a change to the parsers.
+    # nothing is downloaded, filings missing from the cache make the company fail
+    client = OfflineEdgarClient(FilingCache(cache_root))
+
+    scrape_companies(list(df_companies["company"].unique()), client, workers, location, parse_workers)
+
+    print("done!")
+
 
-scrape("final_scrape_status_dict.p", "final_list_issues.p")
\ No newline at end of file
+if __name__ == "__main__":
+    scrape("final_scrape_status.log")
@@ -0,0 +1,89 @@
+from numbers import Integral
+import numpy as np
+import scipy.sparse
+
+# reports are lists of segments (a 10-K and the 10-Qs filed since). the term counts of a report are
+# the sum of the term counts of its segments, so every distinct segment is tokenized once and
+# reports are vectorized by adding up segment rows instead of re-tokenizing the concatenated text.
+
+
+def document_matrix(documents, segment_ids):
+    # sparse (documents x segments) matrix with the number of times each segment appears in a document
+    position = {segment: i for i, segment in enumerate(segment_ids)}
+    rows = np.repeat(np.arange(len(documents)), [len(document) for document in documents])
+    cols = np.array([position[segment] for document in documents for segment in document], dtype=np.int64)
+    values = np.ones(len(cols), dtype=np.int64)
+
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(len(documents), len(segment_ids)))
+
+
+def fit_segment_vectorizer(count_vectorizer, documents, segment_ids, segment_texts, min_df):
+    # fits the vocabulary on the distinct segments and prunes it by document frequency of the summed
+    # counts. gives the same vocabulary as fitting count_vectorizer with min_df on the concatenated reports
+    from sklearn.base import clone
+
+    full_vectorizer = clone(count_vectorizer).set_params(min_df=1, vocabulary=None)
+    segment_counts = full_vectorizer.fit_transform(segment_texts)
+    counts = (document_matrix(documents, segment_ids) @ segment_counts).tocsc()
+
+    if isinstance(min_df, Integral):
+        min_doc_count = min_df
+    else:
+        min_doc_count = min_df * len(documents)
+    doc_freq = np.diff(counts.indptr)
+    keep = np.flatnonzero(doc_freq >= min_doc_count)
+    if len(keep) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df.")
+
+    terms = full_vectorizer.get_feature_names_out()[keep]
+    vectorizer = clone(count_vectorizer).set_params(min_df=1, vocabulary=list(terms))
+
+    return vectorizer, counts[:, keep].tocsr()
+
+
+def count_step(vectorizer):
+    from sklearn.pipeline import Pipeline
+
+    if isinstance(vectorizer, Pipeline):
+        return vectorizer.steps[0][1]
+
+    return vectorizer
+
+
+class SegmentCounter:
+    # term counts of report segments, cached by segment id so that a 10-K shared by several quarters
+    # is tokenized once
+
+    def __init__(self, report_store, vectorizer, max_cached=20000):
+        self.report_store = report_store
+        self.count_vectorizer = count_step(vectorizer)
+        self.max_cached = max_cached
+        self.cache = {}
+
+    def counts(self, documents):
+        segment_ids = sorted({segment for document in documents for segment in document})
+
+        missing = [segment for segment in segment_ids if segment not in self.cache]
+        if len(missing) > 0:
+            if len(self.cache) + len(missing) > self.max_cached:
+                self.cache = {}
+            counts = self.count_vectorizer.transform(self.report_store.segment_texts(missing))
+            for i, segment in enumerate(missing):
+                self.cache[segment] = counts[i]
+
+        if len(segment_ids) == 0:
+            return scipy.sparse.csr_matrix((len(documents), len(self.count_vectorizer.vocabulary_)), dtype=np.int64)
+        segment_counts = scipy.sparse.vstack([self.cache[segment] for segment in segment_ids], format="csr")
+
+        return document_matrix(documents, segment_ids) @ segment_counts
+
+
+def document_term_matrix(documents, vectorizer, counter):
+    # term counts of the reports, weighted by the tfidf step if vectorizer is a (counts, tfidf) pipeline
+    from sklearn.pipeline import Pipeline
+
+    counts = counter.counts(documents)
+    if isinstance(vectorizer, Pipeline):
+        return vectorizer[1:].transform(counts)
+
+    return counts
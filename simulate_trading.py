@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+import predict_covariance_matrix as pcm
+
+# walk-forward backtest of the covariance estimators of a trial over an arbitrary test period. the embedding
+# models and the whole sample regression are trained on the reports up to a quarter before the test period
+
+
+def simulate_trading(params, test_start, test_stop, workers=None, output="results/simulation"):
+    params = dict(pcm.default_params, **params)
+    trial_name = params["trial_name"] or pcm.make_trial_name(params)
+    test_start = pd.Timestamp(test_start)
+    test_stop = pd.Timestamp(test_stop)
+    period = "{}_{}".format(test_start.strftime("%Y%m%d"), test_stop.strftime("%Y%m%d"))
+    train_last = pcm.training_cutoff(test_start)
+
+    report_store, returns_panel = pcm.load_data(params["frequency"])
+    df_frob, backtest = pcm.run_walk_forward(params, report_store, returns_panel, test_start, test_stop, train_last,
+                                             workers=workers)
+
+    results = {
+        "frob": df_frob,
+        "std": backtest.window_std(),
+        "stats": backtest.statistics(252 if params["frequency"] == "daily" else 52),
+        "wealth": backtest.wealth(100),
+    }
+
+    os.makedirs(output, exist_ok=True)
+    for name, df in results.items():
+        df.to_csv(os.path.join(output, "{}_{}_{}.csv".format(name, trial_name, period)), sep=";")
+
+    return results
+
+
+if __name__ == "__main__":
+    params = {"model": "lda", "n_dims": 5, "model_train_sample": "window"}
+    results = simulate_trading(params, "2008-01-01", "2020-12-31")
+    print(results["stats"])
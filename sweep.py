@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import pandas as pd
+import predict_covariance_matrix as pcm
+from model_registry import ModelRegistry
+
+# data and models loaded in a worker process, shared by all trials that run in it
+_data = {}
+_registry = None
+
+
+def parameter_grid(grid):
+    keys = list(grid.keys())
+    trials = []
+    names = set()
+    for values in itertools.product(*(grid[key] for key in keys)):
+        params = dict(pcm.default_params, **dict(zip(keys, values)))
+        params["trial_name"] = pcm.make_trial_name(params)
+        # the name leaves out the parameters a model ignores (n_dims for tfidf, idf for lda and svd), so
+        # grid points that only differ in those are the same trial and would overwrite each other's results
+        if params["trial_name"] in names:
+            continue
+        names.add(params["trial_name"])
+        trials.append(params)
+
+    # trials that use the same embedding model run next to each other. workers that start them at the
+    # same time train the model once, the others wait for it in the registry (see ModelRegistry.get_or_train)
+    trials.sort(key=lambda p: (p["mode"], p["model"], p["n_dims"], p["idf"], p["min_df"], p["frequency"]))
+
+    return trials
+
+
+def load_trial_data(frequency):
+    if frequency not in _data:
+        _data[frequency] = pcm.load_data(frequency)
+
+    return _data[frequency]
+
+
+def run_sweep_trial(params):
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry("models")
+
+    report_store, returns_panel = load_trial_data(params["frequency"])
+    df_frob, df_var, _, _ = pcm.run_trial(params, report_store, returns_panel, _registry)
+
+    row = dict(params)
+    for column in df_frob.columns:
+        row["frob_" + column] = df_frob.loc["all", column]
+    for column in df_var.columns:
+        row["std_" + column] = df_var.loc["whole", column]
+
+    return row
+
+
+def run_sweep(grid, max_workers=None, output="results/sweep.csv"):
+    trials = parameter_grid(grid)
+    print("running {} trials.".format(len(trials)))
+
+    if max_workers == 1:
+        rows = [run_sweep_trial(params) for params in trials]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            rows = list(pool.map(run_sweep_trial, trials))
+
+    df_results = pd.DataFrame(rows).set_index("trial_name")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    df_results.to_csv(output, sep=";")
+
+    return df_results
+
+
+if __name__ == "__main__":
+    grid = {
+        "model": ["lda", "svd"],
+        "n_dims": [5, 10],
+        "ensemble_weight": [0.1, 0.2, 0.3],
+    }
+    df_results = run_sweep(grid)
+    print(df_results[["frob_impr_comb", "std_impr_comb"]])
@@ -0,0 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from pandas import Timedelta
+from pandas.tseries.offsets import QuarterEnd, DateOffset
+from availability import AvailabilityIndex
+from backtest import BacktestAccumulator
+from portfolio import min_variance_weights
+from rolling_cov import RollingCovariance
+
+# a walk-forward backtest moves a sample window and the out-of-sample period after it through time, one
+# horizon at a time. in every step each estimator predicts the covariance of the out-of-sample period from
+# the sample. it is scored by the frobenius error of its prediction and by the realized returns of its
+# minimum variance portfolio.
+# an estimator is a function estimator(window, estimates) of a Window and the estimates of the estimators
+# before it, which returns an n x n covariance matrix
+
+# the engine of the running backtest, inherited by forked worker processes
+_engine = None
+
+
+def walk_forward_windows(test_start, test_stop, sample_quarters=4, horizon_quarters=1):
+    # (sample start, sample stop, out-of-sample start, out-of-sample stop) of the steps whose out-of-sample
+    # periods of horizon_quarters tile [test_start, test_stop]. test_start is the first day of a quarter
+    windows = []
+    test_stop = pd.Timestamp(test_stop)
+    out_of_sample_start = pd.Timestamp(test_start)
+
+    while True:
+        out_of_sample_stop = out_of_sample_start + QuarterEnd(startingMonth=3, n=horizon_quarters)
+        if out_of_sample_stop > test_stop:
+            break
+
+        sample_start = out_of_sample_start - DateOffset(months=3 * sample_quarters)
+        sample_stop = out_of_sample_start - DateOffset(days=1)
+        windows.append((sample_start, sample_stop, out_of_sample_start, out_of_sample_stop))
+        out_of_sample_start = out_of_sample_stop + DateOffset(days=1)
+
+    return windows
+
+
+class Window:
+    # what the estimators of one step see: the sample returns (T x n) of the window companies, their
+    # covariance (ddof 1) and correlation, and the report embeddings before the sample and before the
+    # out-of-sample period, computed on first use
+
+    def __init__(self, engine, dates, companies, returns, cov, cor):
+        self.engine = engine
+        self.sample_start, self.sample_stop, self.out_of_sample_start, self.out_of_sample_stop = dates
+        self.companies = companies
+        self.returns = returns
+        self.cov = cov
+        self.cor = cor
+        self.loaded_features = {}
+
+    def features(self, out_of_sample=False):
+        if out_of_sample not in self.loaded_features:
+            start = self.out_of_sample_start if out_of_sample else self.sample_start
+            reports = self.engine.report_store.reports_for_date(start - Timedelta(days=1), self.companies)
+            self.loaded_features[out_of_sample] = self.engine.feature_store.features(reports)
+
+        return self.loaded_features[out_of_sample]
+
+
+class WalkForward:
+    # runs the estimators, a dict of name -> estimator called in order, over a list of walk_forward_windows.
+    # the feature store is only needed by estimators that use report embeddings
+
+    def __init__(self, report_store, returns_panel, estimators, feature_store=None, availability=None):
+        self.report_store = report_store
+        self.returns_panel = returns_panel
+        self.estimators = dict(estimators)
+        self.feature_store = feature_store
+        if availability is None:
+            availability = AvailabilityIndex(report_store, returns_panel)
+        self.availability = availability
+
+    def evaluate(self, dates, rolling_sample, rolling_out_of_sample):
+        # label, frobenius errors and realized portfolio returns (T x estimators) of one step
+        sample_start, sample_stop, out_of_sample_start, out_of_sample_stop = dates
+
+        # the companies with reports before both periods and complete returns in both, in the same order
+        companies = self.availability.window(
+            [sample_start - Timedelta(days=1), out_of_sample_start - Timedelta(days=1)],
+            [(sample_start, sample_stop), (out_of_sample_start, out_of_sample_stop)])
+        columns = self.availability.returns_columns[companies]
+
+        print("-----------------new test period-----------------")
+        print("reports for: " + str(out_of_sample_start - Timedelta(days=1)))
+
+        # consecutive samples overlap, only the quarters that enter or leave the window are added or removed
+        rolling_sample.move_to(sample_start, sample_stop)
+        cov, cor = rolling_sample.covariance(columns)
+        returns_sample = self.returns_panel.period(sample_start, sample_stop, columns)
+        window = Window(self, dates, self.availability.companies[companies], returns_sample.values, cov, cor)
+
+        estimates = {}
+        for name, estimator in self.estimators.items():
+            estimates[name] = estimator(window, estimates)
+
+        # empirical covariance of the out of sample period
+        rolling_out_of_sample.move_to(out_of_sample_start, out_of_sample_stop)
+        cov_true, _ = rolling_out_of_sample.covariance(columns)
+
+        frob = [np.linalg.norm(cov_true - estimates[name], ord="fro") for name in self.estimators]
+        for name, error in zip(self.estimators, frob):
+            print("frobenius norm for " + name)
+            print(error)
+
+        # minimum variance portfolios of all estimates, one batched factorization
+        weights = min_variance_weights(np.stack(list(estimates.values())))
+        returns_out_of_sample = self.returns_panel.period(out_of_sample_start, out_of_sample_stop, columns)
+
+        return sample_stop, frob, returns_out_of_sample.values @ weights.T
+
+    def run_windows(self, windows):
+        # consecutive windows, they share the quarters of their running sums
+        rolling_sample = RollingCovariance(self.returns_panel)
+        rolling_out_of_sample = RollingCovariance(self.returns_panel)
+
+        return [self.evaluate(dates, rolling_sample, rolling_out_of_sample) for dates in windows]
+
+    def run(self, windows, workers=1):
+        # frobenius errors (window x estimator) and the BacktestAccumulator of the realized returns.
+        # with several workers, every worker process runs a contiguous chunk of the windows
+        global _engine
+        if workers is None:
+            workers = os.cpu_count()
+        workers = min(workers, len(windows))
+
+        # the engine holds the stores and estimators (often closures), so workers are forked rather
+        # than sent a pickled copy. without fork the windows run in this process
+        if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            bounds = np.linspace(0, len(windows), workers + 1).astype(int)
+            chunks = [windows[first:last] for first, last in zip(bounds[:-1], bounds[1:])]
+
+            _engine = self
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                    results = [result for chunk in pool.map(_run_windows, chunks) for result in chunk]
+            finally:
+                _engine = None
+        else:
+            results = self.run_windows(windows)
+
+        backtest = BacktestAccumulator(self.estimators)
+        for label, _, window_returns in results:
+            backtest.append(label, window_returns)
+
+        df_frob = pd.DataFrame([frob for _, frob, _ in results], columns=list(self.estimators),
+                               index=[label for label, _, _ in results])
+
+        return df_frob, backtest
+
+
+def _run_windows(windows):
+    return _engine.run_windows(windows)
@@ -0,0 +1,45 @@
+import numpy as np
+from pairwise import upper_triangle_indices
+
+# the window model fits cov_ij = intercept + slope * sim_ij on the upper triangle of the
+# sample window and applies it to the similarities of the next period.
+# memory: everything is O(n^2). at peak the fit holds one n x n similarity matrix, the
+# upper-triangle index arrays and the flattened x/y vectors, about 4 n x n float64 arrays
+# (32 * n^2 bytes, ~800 MB for 5000 companies). the prediction holds one similarity matrix
+# and the predicted matrix.
+
+
+def fit_window_model(cov, similarities):
+    rows, cols = upper_triangle_indices(cov.shape[0])
+    x = similarities[rows, cols]
+    y = cov[rows, cols]
+
+    x_centered = x - x.mean()
+    x_var = np.dot(x_centered, x_centered)
+
+    # closed form least squares for intercept and slope
+    if x_var > 0:
+        slope = np.dot(x_centered, y - y.mean()) / x_var
+    else:
+        slope = 0.0
+    intercept = y.mean() - slope * x.mean()
+
+    return intercept, slope
+
+
+def predict_window_model(intercept, slope, similarities, variance):
+    matrix = intercept + slope * similarities
+    np.fill_diagonal(matrix, variance)
+
+    return matrix
+
+
+def predict_cov_window_model(prev_cov, feature_data_prev, feature_data_next):
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    intercept, slope = fit_window_model(prev_cov, cosine_similarity(feature_data_prev))
+
+    # the model doesn't predict variances, so the mean variance of the window is used
+    mean_var = np.diagonal(prev_cov).mean()
+
+    return predict_window_model(intercept, slope, cosine_similarity(feature_data_next), mean_var)